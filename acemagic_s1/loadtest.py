@@ -0,0 +1,280 @@
+"""
+Load generator for the API.
+
+Drives the app in-process through httpx's ASGI transport with many concurrent
+clients and reports latency percentiles and throughput for every worker class
+and worker count. The LED and display updates are served by stand-in routes on
+a load test copy of the app, writing to simulated TFT and LED serial devices
+with the packet sizes and pacing of the device scripts in python/. Worker class
+and count default to what hypercorn_conf.py runs the service with. Needs httpx,
+which comes with the dev extra.
+
+    python -m acemagic_s1.loadtest --clients 50 --requests 2000 \
+        --worker-class asyncio uvloop trio --workers 1 2 4
+"""
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import random
+import runpy
+import statistics
+import threading
+import time
+
+import anyio
+from fastapi import Body, FastAPI
+
+from .main import app
+
+WORKER_CLASSES = ["asyncio", "uvloop", "trio"]
+
+# kind -> (method, path, json body) candidates, a kind is only used when the app serves it
+REQUESTS = {
+    "health": [("GET", "/healthz", None), ("GET", "/ping", None), ("GET", "/", None)],
+    "led": [("POST", "/led", None)],
+    "display": [
+        # One tile, and a band of eight, of the 40 a full refresh takes
+        ("POST", "/display/tiles", {"tiles": 1}),
+        ("POST", "/display/tiles", {"tiles": 8}),
+    ],
+}
+DEFAULT_MIX = {"health": 8, "led": 1, "display": 1}
+
+
+class SimulatedTFT:
+    """
+    Stand-in for the TFT OUT endpoint. Takes as long per 0xA2 packet as the
+    panel does (a full 40 tile refresh is about 3 s) and counts the packets.
+    """
+
+    def __init__(self, packet_delay: float = 0.075):
+        self.packet_delay = packet_delay
+        self.packets = 0
+
+    def write(self, data, timeout: int = None) -> int:
+        time.sleep(self.packet_delay)
+        self.packets += 1
+        return len(data)
+
+
+class SimulatedSerial:
+    """
+    Stand-in for the CH340 LED serial port, at the 10000 baud the LED
+    controller is driven with.
+    """
+
+    def __init__(self, baudrate: int = 10000):
+        self.baudrate = baudrate
+        self.written = 0
+        self.is_open = True
+
+    def write(self, data: bytes) -> int:
+        time.sleep(len(data) * 10 / self.baudrate)
+        self.written += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+# What the device scripts send: a mode packet written one byte at a time 5 ms apart by
+# ledsrl.send_command, and one fixed size 0xA2 packet per tile
+LED_PACKET_SIZE = 5
+LED_BYTE_DELAY = 0.005
+TILE_PACKET = bytes(4104)
+
+
+def simulated_app() -> FastAPI:
+    """
+    A copy of the API with stand-in LED and display update routes, writing to simulated devices
+    kept in its state as tft and led. Requests are served from a thread pool, so each device is
+    written by one request at a time.
+    """
+    test = FastAPI(title=f"{app.title} (load test)")
+    test.include_router(app.router)
+    test.state.tft, test.state.led = SimulatedTFT(), SimulatedSerial()
+    tft_lock, led_lock = threading.Lock(), threading.Lock()
+
+    @test.post("/led")
+    def led() -> dict:
+        with led_lock:
+            for _ in range(LED_PACKET_SIZE):
+                test.state.led.write(b"\0")
+                time.sleep(LED_BYTE_DELAY)
+        return {"sent": LED_PACKET_SIZE}
+
+    @test.post("/display/tiles")
+    def display_tiles(tiles: int = Body(1, embed=True, ge=1, le=40)) -> dict:
+        with tft_lock:
+            for _ in range(tiles):
+                test.state.tft.write(TILE_PACKET, 1000)
+        return {"packets": tiles}
+
+    return test
+
+
+def available_mix(mix: dict, target: FastAPI) -> tuple[dict, list]:
+    """Drops the request kinds the app does not serve, returns (mix, skipped kinds)."""
+    served = {
+        (method, route.path)
+        for route in target.routes
+        for method in getattr(route, "methods", None) or ()
+    }
+    usable, skipped = {}, []
+    for kind, weight in mix.items():
+        if weight and all((m, p) in served for m, p, _ in REQUESTS[kind]):
+            usable[kind] = weight
+        elif weight:
+            skipped.append(kind)
+    return usable, skipped
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def run_clients(clients: int, requests: int, mix: dict) -> dict:
+    """Runs `requests` requests over `clients` concurrent clients, in the current event loop."""
+    import httpx
+
+    target = simulated_app()
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    latencies, errors = [], 0
+    remaining = requests
+
+    async def client(http: httpx.AsyncClient):
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            method, path, body = random.choice(REQUESTS[random.choices(kinds, weights)[0]])
+            start = time.perf_counter()
+            try:
+                response = await http.request(method, path, json=body)
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    transport = httpx.ASGITransport(app=target)
+    start = time.perf_counter()
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as http:
+        async with anyio.create_task_group() as group:
+            for _ in range(clients):
+                group.start_soon(client, http)
+    return {
+        "latencies": latencies,
+        "errors": errors,
+        "elapsed": time.perf_counter() - start,
+        "tft_packets": target.state.tft.packets,
+        "led_bytes": target.state.led.written,
+    }
+
+
+def run_worker(worker_class: str, clients: int, requests: int, mix: dict) -> dict:
+    """Entry point of one simulated worker process."""
+    backend = "trio" if worker_class == "trio" else "asyncio"
+    options = {"use_uvloop": True} if worker_class == "uvloop" else {}
+    return anyio.run(run_clients, clients, requests, mix, backend=backend, backend_options=options)
+
+
+def run_config(worker_class: str, workers: int, clients: int, requests: int, mix: dict) -> dict:
+    """Splits clients and requests over `workers` processes, like hypercorn workers, and merges the results."""
+    shares = [
+        (worker_class, max(1, clients // workers), requests // workers + (i < requests % workers), mix)
+        for i in range(workers)
+    ]
+    start = time.perf_counter()
+    if workers == 1:
+        results = [run_worker(*shares[0])]
+    else:
+        with multiprocessing.get_context("spawn").Pool(workers) as pool:
+            results = pool.starmap(run_worker, shares)
+    elapsed = time.perf_counter() - start
+    latencies = [lat for result in results for lat in result["latencies"]]
+    return {
+        "worker_class": worker_class,
+        "workers": workers,
+        "requests": len(latencies),
+        "errors": sum(result["errors"] for result in results),
+        "tft_packets": sum(result["tft_packets"] for result in results),
+        "led_bytes": sum(result["led_bytes"] for result in results),
+        # Busiest worker's wall time, process start-up is not load
+        "throughput": len(latencies) / max(result["elapsed"] for result in results),
+        "elapsed": elapsed,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p90_ms": percentile(latencies, 90) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def backend_available(worker_class: str) -> bool:
+    module = {"uvloop": "uvloop", "trio": "trio"}.get(worker_class)
+    if module is None:
+        return True
+    try:
+        __import__(module)
+    except ImportError:
+        return False
+    return True
+
+
+def hypercorn_defaults(path: str) -> tuple[str, int]:
+    """Worker class and worker count the service runs with under the given hypercorn config file."""
+    if not os.path.exists(path):
+        return "asyncio", 1
+    # The config file prints what it resolved
+    with contextlib.redirect_stdout(io.StringIO()):
+        conf = runpy.run_path(path)
+    return conf["use_worker_class"], conf["use_web_concurrency"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the API against simulated devices")
+    parser.add_argument("--config", default="hypercorn_conf.py",
+                        help="hypercorn config file the worker defaults come from")
+    known, _ = parser.parse_known_args(argv)
+    worker_class, workers = hypercorn_defaults(known.config)
+    parser.add_argument("--clients", type=int, default=50, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per configuration")
+    parser.add_argument("--worker-class", nargs="+", default=[worker_class], choices=WORKER_CLASSES)
+    parser.add_argument("--workers", nargs="+", type=int, default=[workers], help="worker counts to compare")
+    for kind, weight in DEFAULT_MIX.items():
+        parser.add_argument(f"--{kind}", type=int, default=weight, help=f"weight of {kind} requests")
+    args = parser.parse_args(argv)
+    try:
+        import httpx  # noqa: F401
+    except ImportError:
+        parser.error("httpx is not installed, install the dev extra: pip install .[dev]")
+
+    mix, skipped = available_mix({kind: getattr(args, kind) for kind in DEFAULT_MIX}, simulated_app())
+    if skipped:
+        print(f"Skipping request kinds the app does not serve: {', '.join(skipped)}")
+    if not mix:
+        parser.error("no request kind left to send")
+
+    print(f"{'class':8} {'workers':>7} {'requests':>8} {'errors':>6} {'req/s':>9} "
+          f"{'mean ms':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'tiles':>6} {'led B':>6}")
+    for worker_class in args.worker_class:
+        if not backend_available(worker_class):
+            print(f"{worker_class:8} not installed, skipped")
+            continue
+        for workers in args.workers:
+            r = run_config(worker_class, workers, args.clients, args.requests, mix)
+            print(f"{r['worker_class']:8} {r['workers']:>7} {r['requests']:>8} {r['errors']:>6} "
+                  f"{r['throughput']:>9.1f} {r['mean_ms']:>8.2f} {r['p50_ms']:>8.2f} "
+                  f"{r['p90_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['tft_packets']:>6} {r['led_bytes']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+""" Hot-plug device manager for the Acemagic S1 TFT and LED strip.
+This program is free software: you can redistribute it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License.
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import threading
+import logging
+
+import lcddsp
+import ledsrl
+
+LED_VENDOR_ID  = 0x1a86  # QinHeng CH340 serial bridge driving the LED strip
+LED_PRODUCT_ID = 0x7523
+
+logger = logging.getLogger(__name__)
+
+def tft_present() -> bool:
+    """
+    Returns:
+        bool: True when the TFT is on the USB bus
+    """
+    import usb.core
+    return usb.core.find(idVendor=lcddsp.VENDOR_ID, idProduct=lcddsp.PRODUCT_ID) is not None
+
+def led_port():
+    """
+    Returns:
+        str: name of the CH340 serial port, or None when it is not connected
+    """
+    from serial.tools import list_ports
+    for device in list_ports.comports():
+        if device.vid == LED_VENDOR_ID and device.pid == LED_PRODUCT_ID:
+            return device.name
+    return None
+
+# The `DeviceManager` class polls for the TFT and the CH340 LED controller appearing and disappearing.
+# When either comes back it is reconnected and brought back to the last known state: the TFT gets its
+# orientation and the whole current frame, the LED strip gets the last mode that was set.
+class DeviceManager:
+    def __init__(self, tft:lcddsp.S1TFT = None, led:bool = True, interval:float = 2.0):
+        """
+        Args:
+            tft (S1TFT, optional): display to keep connected, ideally created with `lazy=True`. Defaults to None.
+            led (bool, optional): also manage the LED controller. Defaults to True.
+            interval (float, optional): seconds between two polls. Defaults to 2.0.
+        """
+        self.tft = tft
+        self.led = led
+        self.interval = interval
+        self.tftPresent = False
+        self.ledName = None
+        self.ledDevice = None
+        self.ledData = None
+        self.stopEvent = threading.Event()
+        self.thread = None
+
+    def set_led(self, operation:ledsrl.LEDOperation, brightness:ledsrl.LEDIntensity, speed:ledsrl.LEDSpeed):
+        """
+        Sets the LED mode and remembers it, so it can be replayed after a reconnect.
+
+        Args:
+            operation (LEDOperation): LED theme
+            brightness (LEDIntensity): LED intensity
+            speed (LEDSpeed): LED speed
+        """
+        self.ledData = ledsrl.setup_data(operation, brightness, speed)
+        if self.ledDevice is not None:
+            self._send_led()
+
+    def poll(self):
+        """
+        Checks both devices once and handles any change since the previous poll.
+        """
+        if self.tft is not None:
+            present = tft_present()
+            if present and not self.tftPresent and self.tft.writer is None:
+                logger.info("TFT connected")
+                try:
+                    self.tft.reconnect()
+                except Exception as e:
+                    logger.error(f"TFT reconnect failed: {e}")
+                    present = False
+            elif not present and self.tftPresent:
+                logger.info("TFT disconnected")
+                self.tft.disconnect()
+            self.tftPresent = present
+
+        if self.led:
+            name = led_port()
+            if name != self.ledName:
+                self._close_led()
+                if name is not None:
+                    logger.info(f"LED controller connected at {name}")
+                    self._open_led(name)
+                else:
+                    logger.info("LED controller disconnected")
+                self.ledName = name if self.ledDevice is not None else None
+
+    def start(self):
+        """
+        Starts polling in a background thread.
+        """
+        if self.thread is None:
+            self.stopEvent.clear()
+            self.thread = threading.Thread(target=self._run, name="S1-devmgr", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """
+        Stops polling and closes the LED controller.
+        """
+        if self.thread is not None:
+            self.stopEvent.set()
+            self.thread.join()
+            self.thread = None
+        self._close_led()
+        self.ledName = None
+
+    def _run(self):
+        while not self.stopEvent.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Device poll failed: {e}")
+            self.stopEvent.wait(self.interval)
+
+    def _open_led(self, name:str):
+        import serial
+        try:
+            self.ledDevice = serial.Serial(f'/dev/{name}', timeout=10, baudrate=10000)
+        except serial.SerialException as e:
+            logger.error(f"LED controller at {name} not usable: {e}")
+            self.ledDevice = None
+            return
+        if self.ledData is not None:
+            self._send_led()
+
+    def _send_led(self):
+        import serial
+        try:
+            ledsrl.send_command(self.ledDevice, self.ledData)
+        except serial.SerialException as e:
+            logger.error(f"LED write failed: {e}")
+            self._close_led()
+            self.ledName = None
+
+    def _close_led(self):
+        if self.ledDevice is not None:
+            try:
+                self.ledDevice.close()
+            except Exception:
+                pass
+        self.ledDevice = None
+
+
+def main():
+    """main
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description="Keep the S1 TFT and LED strip connected across hot-plugs")
+    parser.add_argument("--journal", metavar="FILE", help="remember what the panel shows across restarts")
+    args = parser.parse_args()
+    ledsrl.setup_logging()
+    tft = lcddsp.S1TFT(34, 40, True, lazy=True, journal=args.journal)
+    tft.load_image("images/a4.jpg")
+    tft.addObject(lcddsp.LCDTime(10, 0, fontSize=34, textColor=(255, 255, 0)))
+    manager = DeviceManager(tft)
+    manager.set_led(ledsrl.LEDOperation.BREATHING, ledsrl.LEDIntensity.LEVEL_1, ledsrl.LEDSpeed.LEVEL_1)
+    manager.start()
+    tft.startScheduler()
+
+if __name__ == "__main__":
+    """ Launcher
+    """
+    main()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+""" Declarative screen layouts for the Acemagic S1 TFT.
+This program is free software: you can redistribute it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License.
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+
+A layout is a YAML or TOML file, for example:
+
+    orientation: vertical
+    tile: [34, 40]
+    background: images/a4.jpg
+    led: {mode: breathing, brightness: 1, speed: 1}
+    widgets:
+      - {type: time, x: 10, y: 0, font: CONTFU.ttf, size: 34, color: [255, 255, 0]}
+      - {type: cpu, x: 10, y: 240, size: 24}
+"""
+
+import os
+import sched
+import time
+
+import lcddsp
+
+# Widget `type` names accepted in layout files
+WIDGETS = {
+    "text": lcddsp.LCDText,
+    "time": lcddsp.LCDTime,
+    "date": lcddsp.LCDDate,
+    "cpu": lcddsp.LCDCPUutil,
+    "cpufreq": lcddsp.LCDCPUfreq,
+    "marquee": lcddsp.LCDMarquee,
+}
+
+# Fields accepted by every widget, and the extra ones of some types, with their expected type
+WIDGET_FIELDS = {"type": str, "x": int, "y": int, "font": str, "size": int, "color": list}
+WIDGET_EXTRA_FIELDS = {
+    "text": {"text": str},
+    "marquee": {"text": str, "width": int, "step": int, "gap": int},
+}
+
+def check_widget(spec:dict):
+    """
+    Args:
+        spec (dict): one entry of the layout `widgets` list
+
+    Raises:
+        ValueError: unknown widget type, unknown field or a field of the wrong type
+    """
+    if not isinstance(spec, dict):
+        raise ValueError(f"Widget must be a mapping, not {spec!r}")
+    kind = spec.get("type")
+    if kind not in WIDGETS:
+        raise ValueError(f"Unknown widget type {kind}")
+    fields = dict(WIDGET_FIELDS, **WIDGET_EXTRA_FIELDS.get(kind, {}))
+    for key, value in spec.items():
+        if key not in fields:
+            raise ValueError(f"Unknown field {key} for a {kind} widget")
+        if not isinstance(value, fields[key]) or isinstance(value, bool):
+            raise ValueError(f"Field {key} of a {kind} widget must be a {fields[key].__name__}, not {value!r}")
+    if "color" in spec:
+        color = spec["color"]
+        if len(color) not in (3, 4) or not all(isinstance(c, int) and 0 <= c <= 255 for c in color):
+            raise ValueError(f"Color of a {kind} widget must be 3 or 4 values from 0 to 255, not {color!r}")
+    for key in ("size", "width", "step", "gap"):
+        if key in spec and spec[key] <= 0:
+            raise ValueError(f"Field {key} of a {kind} widget must be positive, not {spec[key]}")
+
+def led_settings(led:dict) -> tuple:
+    """
+    Args:
+        led (dict): the layout `led` entry
+
+    Raises:
+        ValueError: unknown mode, brightness or speed
+
+    Returns:
+        tuple: LEDOperation, LEDIntensity and LEDSpeed
+    """
+    import ledsrl
+    if not isinstance(led, dict):
+        raise ValueError(f"LED settings must be a mapping, not {led!r}")
+    try:
+        return (ledsrl.LEDOperation[str(led.get("mode", "auto")).upper()],
+                ledsrl.LEDIntensity(led.get("brightness", 3)),
+                ledsrl.LEDSpeed(led.get("speed", 3)))
+    except KeyError:
+        raise ValueError(f"Unknown LED mode {led.get('mode')}")
+
+def load_layout(path:str) -> dict:
+    """
+    Reads a layout file, YAML or TOML depending on the extension, and fills in defaults.
+    The background path is taken relative to the layout file.
+
+    Args:
+        path (str): layout file
+
+    Raises:
+        ValueError: unknown orientation, invalid tile size, LED settings or widget
+
+    Returns:
+        dict: the normalised layout
+    """
+    with open(path) as f:
+        if path.endswith(".toml"):
+            import toml
+            data = toml.load(f)
+        else:
+            import yaml
+            data = yaml.safe_load(f)
+    data = data or {}
+
+    layout = {
+        "orientation": data.get("orientation", "vertical"),
+        "tile": tuple(data.get("tile", (34, 40))),
+        "background": data.get("background"),
+        "led": data.get("led"),
+        "widgets": [],
+    }
+    if layout["orientation"] not in ("vertical", "horizontal"):
+        raise ValueError(f"Unknown orientation {layout['orientation']}")
+    tile = layout["tile"]
+    if len(tile) != 2 or not all(isinstance(v, int) and not isinstance(v, bool) for v in tile) or not lcddsp.tile_fits(*tile):
+        raise ValueError(f"Tile {list(tile)} must be two positive sizes fitting one {lcddsp.TILE_PAYLOAD_SIZE} byte packet")
+    if layout["background"]:
+        layout["background"] = os.path.join(os.path.dirname(path), layout["background"])
+    if layout["led"]:
+        led_settings(layout["led"])
+    for widget in data.get("widgets", []):
+        check_widget(widget)
+        layout["widgets"].append(dict(widget))
+    return layout
+
+def create_widget(spec:dict) -> lcddsp.LCDObject:
+    """
+    Args:
+        spec (dict): one entry of the layout `widgets` list
+
+    Returns:
+        LCDObject: the widget, with the spec it was built from kept in `spec`
+    """
+    kwargs = {}
+    if "color" in spec: kwargs["textColor"] = tuple(spec["color"])
+    if "font" in spec: kwargs["fontName"] = spec["font"]
+    if "size" in spec: kwargs["fontSize"] = spec["size"]
+    if spec["type"] in ("text", "marquee"): kwargs["text"] = spec.get("text", "TEXT")
+    if spec["type"] == "marquee":
+        for key in ("width", "step", "gap"):
+            if key in spec: kwargs[key] = spec[key]
+    obj = WIDGETS[spec["type"]](spec.get("x", 0), spec.get("y", 0), **kwargs)
+    obj.spec = spec
+    return obj
+
+def build_display(layout:dict, lazy:bool = True, headless:bool = False, capture:int = 0,
+                  journal:str = None) -> lcddsp.S1TFT:
+    """
+    Args:
+        layout (dict): layout from `load_layout`
+        lazy (bool, optional): connect to the device on the first render. Defaults to True.
+        headless (bool, optional): render offscreen, without a device. Defaults to False.
+        capture (int, optional): when headless, number of rendered frames kept. Defaults to 0.
+        journal (str, optional): panel journal state file, see `S1TFT`. Defaults to None.
+
+    Returns:
+        S1TFT: display with the background loaded and the widgets added
+    """
+    d_width, d_height = layout["tile"]
+    tft = lcddsp.S1TFT(d_width, d_height, layout["orientation"] == "vertical", lazy=lazy,
+                       headless=headless, capture=capture, journal=journal)
+    if layout["background"]:
+        tft.load_image(layout["background"])
+    for spec in layout["widgets"]:
+        tft.addObject(create_widget(spec))
+    return tft
+
+def apply_led(layout:dict, manager):
+    """
+    Args:
+        layout (dict): layout from `load_layout`
+        manager (DeviceManager): device manager driving the LED controller
+    """
+    led = layout["led"]
+    if not led or manager is None: return
+    manager.set_led(*led_settings(led))
+
+def reload_layout(tft:lcddsp.S1TFT, old:dict, new:dict, manager = None) -> lcddsp.S1TFT:
+    """
+    Moves a display from one layout to another touching as little of the panel as possible.
+    Widgets that did not change are kept as they are, removed or changed widgets are erased
+    and only the tiles they covered are repainted. Only a new orientation or tile size needs
+    a fresh display, and only a new background repaints the whole panel.
+
+    Args:
+        tft (S1TFT): display currently showing `old`
+        old (dict): current layout
+        new (dict): layout to switch to
+        manager (DeviceManager, optional): device manager for LED changes. Defaults to None.
+
+    Returns:
+        S1TFT: the display showing `new`, `tft` itself unless it had to be rebuilt
+    """
+    if (old["orientation"], old["tile"]) != (new["orientation"], new["tile"]):
+        print("Layout geometry changed, rebuilding display")
+        journal = tft.journal.path if tft.journal is not None else None
+        tft.close()
+        tft = build_display(new, headless=tft.headless, capture=tft.capture, journal=journal)
+        if manager is not None: manager.tft = tft
+    else:
+        if old["background"] != new["background"]:
+            if new["background"]: tft.load_image(new["background"])
+            else: tft.clear_image()
+        remaining = list(new["widgets"])
+        for obj in list(tft.objects):
+            spec = getattr(obj, "spec", None)
+            if spec in remaining:
+                remaining.remove(spec)
+            else:
+                tft.removeObject(obj)
+        for spec in remaining:
+            tft.addObject(create_widget(spec))
+
+    if old["led"] != new["led"]:
+        apply_led(new, manager)
+    return tft
+
+# The `LayoutDisplay` class drives a display from a layout file and reloads it whenever the file
+# changes on disk, a broken edit keeps the previous layout on screen.
+class LayoutDisplay:
+    def __init__(self, path:str, manager = None, journal:str = None):
+        """
+        Args:
+            path (str): layout file
+            manager (DeviceManager, optional): device manager to keep in sync. Defaults to None.
+            journal (str, optional): panel journal state file, see `S1TFT`. Defaults to None.
+        """
+        self.path = path
+        self.manager = manager
+        self.mtime = os.stat(path).st_mtime
+        self.layout = load_layout(path)
+        self.tft = build_display(self.layout, journal=journal)
+        if manager is not None: manager.tft = self.tft
+        apply_led(self.layout, manager)
+        self.scheduler = None
+
+    def check(self) -> bool:
+        """
+        Returns:
+            bool: True when the file changed and the new layout was applied
+        """
+        mtime = os.stat(self.path).st_mtime
+        if mtime == self.mtime: return False
+        self.mtime = mtime
+        try:
+            layout = load_layout(self.path)
+            print(f"Reloading layout {self.path}")
+            self.tft = reload_layout(self.tft, self.layout, layout, self.manager)
+        except Exception as e:
+            print(f"Layout {self.path} not reloaded: {e}")
+            return False
+        self.layout = layout
+        return True
+
+    def tick(self):
+        self.scheduler.enterabs(time.time() + 1, 1000, self.tick)
+        self.check()
+        self.tft.drawObjects()
+        self.tft.render()
+
+    def run(self):
+        self.scheduler = sched.scheduler(time.time, time.sleep)
+        self.scheduler.enterabs(time.time() + 1, 1000, self.tick)
+        self.scheduler.run()
+
+
+def preview(path:str, directory:str, frames:int = 1) -> list:
+    """
+    Renders a layout offscreen for a number of ticks and writes every frame as a PNG,
+    no device needed.
+
+    Args:
+        path (str): layout file
+        directory (str): where the frames are written
+        frames (int, optional): ticks to render. Defaults to 1.
+
+    Returns:
+        list: the files written
+    """
+    tft = build_display(load_layout(path), headless=True, capture=frames)
+    for i in range(frames):
+        tft.drawObjects()
+        tft.render()
+    tft.close()
+    return tft.endpoint.export_frames(directory)
+
+
+def main():
+    """main
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description="Drive the S1 TFT from a layout file")
+    parser.add_argument("layout", nargs="?", default="layouts/default.yaml")
+    parser.add_argument("--preview", metavar="DIR", help="render offscreen and write the frames to DIR")
+    parser.add_argument("--frames", type=int, default=1, help="frames rendered by --preview")
+    parser.add_argument("--journal", metavar="FILE", help="remember what the panel shows across restarts")
+    args = parser.parse_args()
+    if args.preview:
+        for path in preview(args.layout, args.preview, args.frames): print(path)
+    else:
+        import devmgr
+        manager = devmgr.DeviceManager()
+        display = LayoutDisplay(args.layout, manager, args.journal)
+        manager.start()
+        display.run()
+
+if __name__ == "__main__":
+    """ Launcher
+    """
+    main()
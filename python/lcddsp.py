@@ -22,22 +22,534 @@ __status__ = "Production"
 __version__ = "1.0.0"
 
 import random
-import usb.core
-import usb.backend.libusb1
+import array
+import queue
+import threading
+import hashlib
+import mmap
+import os
+import struct
+import collections
+import contextlib
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
 from time import sleep
 from os import read
 import time
 from datetime import datetime
 from PIL import Image, ImageColor, ImageDraw, ImageDraw2, ImageFont, ImageOps, ImageChops
 import sched
-import glob
-from pprint import pprint
-import math
-import psutil
+# pyusb, psutil and pprint are imported where they are used so that importing this module is cheap
+# and has no side effects. With `S1TFT(..., lazy=True)` the device is only looked up on the first render.
 
 VENDOR_ID  = 0x04d9  # OnTrak Control Systems Inc. vendor ID
 PRODUCT_ID = 0xfd01  # ADU100 Device product name - change this to match your product
 
+# The panel in its own orientation, whatever way the screen is used
+PANEL_WIDTH  = 320
+PANEL_HEIGHT = 170
+
+# Every 0xA2 partial update is an 8 byte header followed by a fixed 4096 byte payload
+TILE_HEADER_SIZE  = 8
+TILE_PAYLOAD_SIZE = 4096
+TILE_PACKET_SIZE  = TILE_HEADER_SIZE + TILE_PAYLOAD_SIZE
+
+# Smallest repaint worth handing to encoding worker processes. Sharing the frame and dispatching the
+# rows costs about 1.8 ms a frame against 0.23 ms to encode a tile, which two workers win back from
+# about 16 tiles on
+PARALLEL_MIN_TILES = 16
+
+def tile_fits(w:int, h:int) -> bool:
+    """
+    Returns:
+        bool: True when a w x h tile fits one 0xA2 packet, its sides in the header bytes and its pixels in the payload
+    """
+    return 0 < w <= 255 and 0 < h <= 255 and w * h * 2 <= TILE_PAYLOAD_SIZE
+
+# Lookup tables splitting RGB888 channels into the high and low bytes of big endian RGB565
+_RGB565_HI_R = [v & 0xF8 for v in range(256)]
+_RGB565_HI_G = [v >> 5 for v in range(256)]
+_RGB565_LO_G = [(v & 0x1C) << 3 for v in range(256)]
+_RGB565_LO_B = [v >> 3 for v in range(256)]
+_ZERO_PAYLOAD = memoryview(bytes(TILE_PAYLOAD_SIZE))
+# And back, from the RGB565 bytes to RGB888 channels
+_RGB565_DEC_R  = [v & 0xF8 for v in range(256)]
+_RGB565_DEC_GH = [(v & 0x07) << 5 for v in range(256)]
+_RGB565_DEC_GL = [(v >> 3) & 0x1C for v in range(256)]
+_RGB565_DEC_B  = [(v & 0x1F) << 3 for v in range(256)]
+
+_tft_device = None
+
+def find_tft(refresh:bool = False):
+    """
+    Looks the TFT up on the USB bus. The result is cached for the lifetime of the process,
+    so only the first caller pays for the enumeration.
+
+    Args:
+        refresh (bool, optional): enumerate again instead of using the cached result. Defaults to False.
+
+    Returns:
+        usb.core.Device: the TFT, or None when it is not connected
+    """
+    global _tft_device
+    if _tft_device is None or refresh:
+        import usb.core
+        _tft_device = usb.core.find(idVendor=VENDOR_ID, idProduct=PRODUCT_ID)
+    return _tft_device
+
+def encode_rgb565(image:Image) -> bytes:
+    """
+    Encodes an image as big endian RGB565 using per channel lookup tables, so no pixel
+    is touched from Python.
+
+    Args:
+        image (Image): tile to encode, any mode convertible to RGB, alpha is ignored
+
+    Returns:
+        bytes: two bytes per pixel in row major order
+    """
+    # The channels are read straight out of RGB and RGBA tiles, with no converted copy
+    if image.mode not in ("RGB", "RGBA"): image = image.convert("RGB")
+    r, g, b = (image.getchannel(band) for band in range(3))
+    hi = ImageChops.add(r.point(_RGB565_HI_R, "L"), g.point(_RGB565_HI_G, "L"))
+    lo = ImageChops.add(g.point(_RGB565_LO_G, "L"), b.point(_RGB565_LO_B, "L"))
+    return Image.merge("LA", (hi, lo)).tobytes()
+
+# Shared memory frames attached by an encoding worker process, by segment name
+_worker_frames = {}
+
+def encode_shared_band(name:str, boxes:list) -> list:
+    """
+    Runs in an encoding worker process of `S1TFT`. Encodes tiles of one device row of the
+    composited frame the display keeps in shared memory, only that row is copied out of it.
+
+    Args:
+        name (str): shared memory segment holding the frame, RGBA at panel size
+        boxes (list): device x, y, width and height of the tiles to encode, all on one row
+
+    Returns:
+        list: RGB565 payload of every tile
+    """
+    memory = _worker_frames.get(name)
+    if memory is None:
+        memory = _worker_frames[name] = shared_memory.SharedMemory(name=name)
+    frame = Image.frombuffer("RGBA", (PANEL_WIDTH, PANEL_HEIGHT), memory.buf, "raw", "RGBA", 0, 1)
+    left, top = boxes[0][0], boxes[0][1]
+    band = frame.crop([left, top, boxes[-1][0] + boxes[-1][2], top + boxes[0][3]])
+    return [encode_rgb565(band.crop([x - left, 0, x - left + w, h])) for x, y, w, h in boxes]
+
+# The `TilePacket` class is a preallocated 0xA2 packet that is filled in place for every tile.
+# It is backed by an `array.array` because pyusb passes those to libusb without copying them.
+class TilePacket:
+    def __init__(self):
+        self.buffer = array.array("B", bytes(TILE_PACKET_SIZE))
+        self.view = memoryview(self.buffer)
+        self.payload = self.view[TILE_HEADER_SIZE:]
+        self.used = 0
+        # Set by the sender to identify the tile once the write completed
+        self.tag = None
+        self.buffer[0], self.buffer[1] = 0x55, 0xA2
+
+    def fill(self, image:Image, x:int, y:int, w:int, h:int):
+        """
+        Args:
+            image (Image): tile image, w x h pixels
+            x (int): device x offset of the tile
+            y (int): device y offset of the tile
+            w (int): tile width
+            h (int): tile height
+
+        Returns:
+            array: the complete packet, ready for `endpoint.write`
+        """
+        return self.fill_encoded(encode_rgb565(image), x, y, w, h)
+
+    def fill_encoded(self, data:bytes, x:int, y:int, w:int, h:int):
+        """
+        Same as `fill` for a tile that is already RGB565 encoded.
+
+        Returns:
+            array: the complete packet, ready for `endpoint.write`
+        """
+        buf = self.buffer
+        self.tag = None
+        buf[0], buf[1] = 0x55, 0xA2
+        buf[2], buf[3] = x & 0xFF, (x >> 8) & 0xFF
+        buf[4], buf[5] = y & 0xFF, (y >> 8) & 0xFF
+        buf[6], buf[7] = w, h
+        n = len(data)
+        self.payload[:n] = data
+        # Only zero what the previous tile left behind past the new payload
+        if n < self.used:
+            self.payload[n:self.used] = _ZERO_PAYLOAD[:self.used - n]
+        self.used = n
+        return buf
+
+    def command(self, header):
+        """
+        Turns the packet into a bare command, such as the 0xA1 orientation packet, with an
+        empty payload.
+
+        Args:
+            header (list): the 8 header bytes
+
+        Returns:
+            array: the complete packet, ready for `endpoint.write`
+        """
+        self.tag = None
+        self.view[:TILE_HEADER_SIZE] = bytes(header)
+        if self.used:
+            self.payload[:self.used] = _ZERO_PAYLOAD[:self.used]
+        self.used = 0
+        return self.buffer
+
+    def digest(self) -> bytes:
+        """
+        Returns:
+            bytes: short hash of the header and payload, identifies what the tile shows
+        """
+        return hashlib.blake2b(self.view[:TILE_HEADER_SIZE + self.used], digest_size=8).digest()
+
+# The `PanelJournal` class remembers what was last committed to each tile of the panel, as a hash per
+# tile in an mmap'd state file. A restarted process can then skip every tile the panel still shows.
+# Layout: 4 byte magic, orientation, reserved byte, columns and rows as uint16, padding to 16 bytes,
+# then one 8 byte digest per tile in device row major order, all zeros meaning unknown.
+class PanelJournal:
+    MAGIC = b"S1TJ"
+    HEADER = struct.Struct("<4sBBHH6x")
+    DIGEST_SIZE = 8
+
+    def __init__(self, path:str, isVertical:bool, cols:int, rows:int):
+        """
+        Args:
+            path (str): state file, created when missing
+            isVertical (bool): orientation the panel is driven in
+            cols (int): tiles per device row
+            rows (int): tile rows on the device
+        """
+        self.path = path
+        self.cols, self.rows = cols, rows
+        self.header = self.HEADER.pack(self.MAGIC, 2 if isVertical else 1, 0, cols, rows)
+        size = self.HEADER.size + cols * rows * self.DIGEST_SIZE
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        if self.mm[:self.HEADER.size] != self.header:
+            # Another orientation or tile grid, nothing recorded applies
+            print(f"Panel journal {path} does not match, starting empty")
+            self.reset()
+
+    def offset(self, index:int) -> int:
+        return self.HEADER.size + index * self.DIGEST_SIZE
+
+    def matches(self, index:int, digest:bytes) -> bool:
+        """
+        Returns:
+            bool: True when the tile was last committed with exactly this content
+        """
+        o = self.offset(index)
+        return self.mm[o:o + self.DIGEST_SIZE] == digest
+
+    def record(self, index:int, digest:bytes):
+        o = self.offset(index)
+        self.mm[o:o + self.DIGEST_SIZE] = digest
+
+    def forget(self, index:int):
+        self.record(index, bytes(self.DIGEST_SIZE))
+
+    def reset(self):
+        """
+        Forgets every tile, used when the panel content is unknown (power cycle, reconnect).
+        """
+        self.mm[:] = bytes(len(self.mm))
+        self.mm[:self.HEADER.size] = self.header
+
+    def close(self):
+        self.mm.flush()
+        self.mm.close()
+
+# The `TileMap` class is the set of dirty tiles on the device grid, kept as the bits of one integer in
+# device row major order, bit `row * cols + col`. Marking a rectangle, merging two maps and walking the
+# set tiles are whole-integer operations, so the cost does not grow with the number of tiles touched.
+class TileMap:
+    def __init__(self, cols:int, rows:int):
+        """
+        Args:
+            cols (int): tiles per device row
+            rows (int): tile rows on the device
+        """
+        self.cols, self.rows = cols, rows
+        self.full = (1 << (cols * rows)) - 1
+        self.bits = 0
+
+    def _rows_mask(self, col0:int, col1:int, row0:int, row1:int) -> int:
+        # One row of set columns, repeated over the rows by multiplying with 1 + 2^cols + 2^2cols...
+        row = ((1 << (col1 - col0 + 1)) - 1) << col0
+        repeat = ((1 << ((row1 - row0 + 1) * self.cols)) - 1) // ((1 << self.cols) - 1)
+        return (row * repeat) << (row0 * self.cols)
+
+    def mark_all(self):
+        self.bits = self.full
+
+    def clear(self):
+        self.bits = 0
+
+    def mark(self, col:int, row:int):
+        self.bits |= 1 << (row * self.cols + col)
+
+    def mark_rect(self, col0:int, row0:int, col1:int, row1:int):
+        """
+        Marks every tile from (col0, row0) to (col1, row1) inclusive, clamped to the grid.
+        """
+        col0, row0 = max(0, col0), max(0, row0)
+        col1, row1 = min(self.cols - 1, col1), min(self.rows - 1, row1)
+        if col0 > col1 or row0 > row1: return
+        self.bits |= self._rows_mask(col0, col1, row0, row1)
+
+    def union(self, other:"TileMap"):
+        self.bits |= other.bits
+
+    def is_set(self, col:int, row:int) -> bool:
+        return bool(self.bits >> (row * self.cols + col) & 1)
+
+    def count(self) -> int:
+        return bin(self.bits).count("1")
+
+    def __bool__(self) -> bool:
+        return self.bits != 0
+
+    def tiles(self):
+        """
+        Yields the set tiles as (col, row) in send order: device row major, the order in
+        which the panel itself scans.
+        """
+        bits, cols = self.bits, self.cols
+        while bits:
+            low = bits & -bits
+            yield divmod(low.bit_length() - 1, cols)[::-1]
+            bits ^= low
+
+    def take(self) -> list:
+        """
+        Returns:
+            list: the set tiles in send order, the map is cleared
+        """
+        tiles = list(self.tiles())
+        self.bits = 0
+        return tiles
+
+    def __str__(self) -> str:
+        return "\n".join("".join("#" if self.is_set(c, r) else "." for c in range(self.cols)) for r in range(self.rows))
+
+def decode_rgb565(data:bytes, size) -> Image:
+    """
+    Args:
+        data (bytes): big endian RGB565 pixels, row major
+        size (tuple): width and height
+
+    Returns:
+        Image: the pixels as an RGB image
+    """
+    hi, lo = Image.frombytes("LA", size, bytes(data)).split()
+    r = hi.point(_RGB565_DEC_R, "L")
+    g = ImageChops.add(hi.point(_RGB565_DEC_GH, "L"), lo.point(_RGB565_DEC_GL, "L"))
+    b = lo.point(_RGB565_DEC_B, "L")
+    return Image.merge("RGB", (r, g, b))
+
+# The `OffscreenPanel` class stands in for the TFT endpoint. It accepts the same packets and keeps
+# the RGB565 framebuffer the panel would show, so the whole widget, composite, encode and writer
+# pipeline runs without a device. Frames can be kept in a ring of the last `capture` renders.
+class OffscreenPanel:
+    WIDTH, HEIGHT = PANEL_WIDTH, PANEL_HEIGHT
+
+    def __init__(self, capture:int = 0):
+        """
+        Args:
+            capture (int, optional): frames kept by `capture_frame`, 0 keeps none. Defaults to 0.
+        """
+        self.framebuffer = bytearray(self.WIDTH * self.HEIGHT * 2)
+        self.orientation = None
+        self.packets = 0
+        self.frames = collections.deque(maxlen=capture) if capture else None
+
+    def write(self, data, timeout:int = None) -> int:
+        data = memoryview(data)
+        self.packets += 1
+        if data[1] == 0xA1:
+            self.orientation = data[3]
+        elif data[1] == 0xA2:
+            x, y = data[2] | data[3] << 8, data[4] | data[5] << 8
+            w, h = data[6], data[7]
+            row = w * 2
+            for line in range(h):
+                start = ((y + line) * self.WIDTH + x) * 2
+                src = TILE_HEADER_SIZE + line * row
+                self.framebuffer[start:start + row] = data[src:src + row]
+        return len(data)
+
+    def decode(self, data:bytes) -> Image:
+        # Turned back to screen orientation when the panel was set up vertical
+        image = decode_rgb565(data, (self.WIDTH, self.HEIGHT))
+        if self.orientation == 2: image = image.transpose(Image.Transpose.ROTATE_270)
+        return image
+
+    def image(self) -> Image:
+        """
+        Returns:
+            Image: what the panel currently shows
+        """
+        return self.decode(self.framebuffer)
+
+    def capture_frame(self):
+        """
+        Keeps a copy of the current framebuffer in the ring, decoded only on export.
+        """
+        if self.frames is not None:
+            self.frames.append(bytes(self.framebuffer))
+
+    def export_png(self, path:str, index:int = -1):
+        """
+        Args:
+            path (str): PNG file to write
+            index (int, optional): captured frame, the current framebuffer when nothing was captured. Defaults to -1.
+        """
+        data = self.frames[index] if self.frames else self.framebuffer
+        self.decode(data).save(path, "PNG")
+
+    def export_frames(self, directory:str, prefix:str = "frame") -> list:
+        """
+        Writes every captured frame as a numbered PNG sequence.
+
+        Returns:
+            list: the files written
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for i, data in enumerate(self.frames or []):
+            path = os.path.join(directory, f"{prefix}_{i:05d}.png")
+            self.decode(data).save(path, "PNG")
+            paths.append(path)
+        return paths
+
+# The `TileWriter` class submits packets to the TFT endpoint. With more than one packet in flight a
+# background thread does the USB writes, so the next tile is encoded while the previous one is on the
+# wire, and `flush` waits for the whole frame. Failed writes are retried and counted instead of dropped.
+class TileWriter:
+    def __init__(self, endpoint, inflight:int = 4, timeout:int = 1000, retries:int = 2):
+        """
+        Args:
+            endpoint: pyusb OUT endpoint of the TFT
+            inflight (int, optional): packets that may be queued at once, 1 writes synchronously. Defaults to 4.
+            timeout (int, optional): per write timeout in milliseconds. Defaults to 1000.
+            retries (int, optional): extra attempts for a failed write. Defaults to 2.
+        """
+        self.endpoint = endpoint
+        self.inflight = max(1, inflight)
+        self.timeout = timeout
+        self.retries = retries
+        self.sent = self.retried = self.timeouts = self.failed = 0
+        self.lastError = None
+        # Optional callbacks taking the packet, called from the writer thread
+        self.onSent = None
+        self.onFailed = None
+        self.free = queue.Queue()
+        for _ in range(self.inflight):
+            self.free.put(TilePacket())
+        self.pending = queue.Queue()
+        self.thread = None
+        if self.inflight > 1:
+            self.thread = threading.Thread(target=self._run, name="S1TFT-writer", daemon=True)
+            self.thread.start()
+
+    def acquire(self) -> TilePacket:
+        """
+        Returns:
+            TilePacket: a free packet, blocks while all of them are in flight
+        """
+        return self.free.get()
+
+    def release(self, packet:TilePacket):
+        """
+        Returns a packet obtained from `acquire` without sending it.
+        """
+        self.free.put(packet)
+
+    def submit(self, packet:TilePacket):
+        """
+        Args:
+            packet (TilePacket): packet obtained from `acquire`, filled by the caller
+        """
+        if self.thread is None:
+            try:
+                self._write(packet)
+            finally:
+                # The only packet of a synchronous writer, losing it would block the next `acquire`
+                self.free.put(packet)
+        else:
+            self.pending.put(packet)
+
+    def flush(self):
+        """
+        Blocks until every submitted packet has been written or has failed.
+        """
+        if self.thread is not None:
+            self.pending.join()
+
+    def close(self):
+        """
+        Flushes and stops the writer thread.
+        """
+        if self.thread is not None:
+            self.flush()
+            self.pending.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def stats(self) -> dict:
+        return {"sent": self.sent, "retried": self.retried, "timeouts": self.timeouts, "failed": self.failed}
+
+    def _write(self, packet:TilePacket) -> bool:
+        import usb.core
+        for attempt in range(self.retries + 1):
+            try:
+                self.endpoint.write(packet.buffer, self.timeout)
+                self.sent += 1
+                if self.onSent is not None: self.onSent(packet)
+                return True
+            except usb.core.USBTimeoutError as e:
+                self.timeouts += 1
+                self.lastError = e
+            except usb.core.USBError as e:
+                self.lastError = e
+            if attempt < self.retries:
+                self.retried += 1
+        self.failed += 1
+        print(f"Tile write failed after {self.retries + 1} attempts: {self.lastError}")
+        if self.onFailed is not None: self.onFailed(packet)
+        return False
+
+    def _run(self):
+        while True:
+            packet = self.pending.get()
+            if packet is None:
+                self.pending.task_done()
+                break
+            try:
+                self._write(packet)
+            except Exception as e:
+                # Never let the writer thread die, `flush` would wait for it forever
+                self.failed += 1
+                self.lastError = e
+                print(f"Tile writer error: {e}")
+            finally:
+                self.free.put(packet)
+                self.pending.task_done()
+
 # The `LCDObject` class defines an object with default attributes and a method for drawing on a
 # background image and a text image.
 class LCDObject:
@@ -49,6 +561,8 @@ class LCDObject:
         print(f"Creating object...")
         self.x=50
         self.y=50
+        # Bounds of the last draw, so the area can be erased when the object goes away
+        self.bounds=None
     
     def draw(self,bgImage:Image, txtIimage:Image):
         """
@@ -67,6 +581,15 @@ class LCDObject:
         print(":Default Render:")
         pass
 
+    def attach(self, tft:"S1TFT"):
+        """
+        Called when the object is added to a display, lets it adapt to the display geometry.
+
+        :param tft: The display the object was added to
+        :type tft: S1TFT
+        """
+        pass
+
 # This Python class defines an LCDText object with properties such as text, size, font, and methods
 # for drawing text on an image.
 class LCDText(LCDObject):
@@ -218,6 +741,7 @@ class LCDCPUutil(LCDText):
         :return: The `draw` method returns the `txtImage` with the text rendered on it along with the
         bounding box of the text.
         """
+        import psutil
         draw = ImageDraw.Draw(txtImage)
         self.text = f"{psutil.cpu_percent():^4}%"
         print(f":CPU Util Render: {self.text}")                
@@ -226,6 +750,70 @@ class LCDCPUutil(LCDText):
         draw.text((self.x,self.y) , text=self.text, font=self.font, fill=self.color, stroke_fill=(255,0,0))
         return(txtImage,bounds)
 
+# The `LCDMarquee` class scrolls a string too long for the screen through a fixed window. The string is
+# rasterized once into a cached strip and every tick only a window of that strip is pasted. The window is
+# aligned to the tile grid and moves by whole tiles, so each update is a whole number of 0xA2 packets.
+class LCDMarquee(LCDText):
+    type="marquee"
+    def __init__(self,x,y,text="TEXT", textColor:ImageColor=(255,255,255), fontName="default", fontSize=24,
+                 width:int=None, step:int=None, gap:int=None):
+        """
+        :param x: Left edge of the window, moved out to the device tile grid when added to a display
+        :param y: Top edge of the window, moved out to the device tile grid when added to a display
+        :param text: The string to scroll
+        :param width: Window width in pixels, grown to whole device tiles. Defaults to the rest of the row
+        :param step: Pixels scrolled per tick. Defaults to one tile width
+        :param gap: Blank pixels between the end of the string and its next repetition. Defaults to one tile width
+        """
+        super().__init__(x,y,text,textColor,fontName, fontSize)
+        self.width, self.step, self.gap = width, step, gap
+        self.windowHeight = None
+        self.offset = 0
+        self.strip = None
+        self.stripText = None
+        self.stripLength = 0
+
+    def attach(self, tft:"S1TFT"):
+        left, top, right, bottom = self.font.getbbox(self.text or " ")
+        width = self.width if self.width is not None else tft.width - self.x
+        # The grid is snapped in device coordinates, in vertical mode screen x runs against device y
+        # and tiles that do not divide the panel leave the screen grid offset from zero
+        self.x, self.y, x2, y2 = tft.tile_window((self.x, self.y, self.x + max(1, width), self.y + max(1, bottom)))
+        self.width, self.windowHeight = x2 - self.x, y2 - self.y
+        if self.step is None: self.step = tft.d_width
+        if self.gap is None: self.gap = tft.d_width
+        self.strip = None
+
+    def render_strip(self):
+        """
+        Rasterizes the text into the strip, only when the text changed. The strip holds the text
+        and gap followed by a window's worth of repetition, so any window is one crop.
+        """
+        if self.strip is not None and self.stripText == self.text: return
+        left, top, right, bottom = self.font.getbbox(self.text)
+        self.stripLength = right + self.gap
+        copies = 1 + -(-self.width // self.stripLength)
+        self.strip = Image.new("RGBA", (self.stripLength * copies, self.windowHeight), (0,0,0,125))
+        draw = ImageDraw.Draw(self.strip)
+        for i in range(copies):
+            draw.text((i * self.stripLength, 0), text=self.text, font=self.font, fill=self.color)
+        self.stripText = self.text
+        self.offset = 0
+
+    def draw(self,bgImage:Image,txtImage:Image):
+        """
+        Pastes the current window of the strip and advances it by one step.
+
+        :return: The text image and the bounds of the whole window
+        """
+        if self.windowHeight is None:
+            raise ValueError("LCDMarquee must be added to a display with addObject")
+        self.render_strip()
+        window = self.strip.crop((self.offset, 0, self.offset + self.width, self.windowHeight))
+        txtImage.paste(window, (self.x, self.y))
+        self.offset = (self.offset + self.step) % self.stripLength
+        return(txtImage,(self.x, self.y, self.x + self.width - 1, self.y + self.windowHeight - 1))
+
 # This Python class, LCDCPUfreq, is a subclass of LCDText that displays the current CPU frequency on
 # an LCD screen with specified text color, font, and size.
 class LCDCPUfreq(LCDText):
@@ -246,6 +834,7 @@ class LCDCPUfreq(LCDText):
         :return: The `draw` method returns the `txtImage` with the CPU utilization text drawn on it along
         with the bounding box of the text.
         """
+        import psutil
         draw = ImageDraw.Draw(txtImage)
         self.text = f"{round(psutil.cpu_freq().current,0)}"
         print(f":CPU Util Render: {self.text}")                
@@ -265,14 +854,17 @@ class S1TFT:
     """
     device = None
     endpoint = None
+    writer = None
+    stale = False
     scheduler = None
     font_name = "DEFAULT"
-    font = ImageFont.load_default(12)
+    font = None
     imageFileList = []
     timeCounter = 0
     
     # True is vertical and false is horizontal
-    def __init__(self, d_width, d_height, isVertical:bool = False, font_name="DEFAULT"):
+    def __init__(self, d_width, d_height, isVertical:bool = False, font_name="DEFAULT", inflight:int = 4, lazy:bool = False,
+                 journal:str = None, workers:int = 0, headless:bool = False, capture:int = 0):
         """ Args:
             width ([type]): [description]
             height ([type]): [description]
@@ -280,37 +872,119 @@ class S1TFT:
             d_height ([type]): [description]
             orientation (bool): [description]
             font_name (str, optional): [description]. Defaults to "DEFAULT".
+            inflight (int, optional): tile packets queued to the USB writer at once. Defaults to 4.
+            lazy (bool, optional): defer finding and connecting the device until the first render. Defaults to False.
+            journal (str, optional): state file recording what the panel shows, tiles it already shows
+                are not sent again after a restart. Defaults to None.
+            workers (int, optional): processes encoding large repaints in parallel,
+                0 does everything on the calling thread. Defaults to 0.
+            headless (bool, optional): render into an `OffscreenPanel` instead of the device. Defaults to False.
+            capture (int, optional): when headless, number of rendered frames kept for export. Defaults to 0.
         """ 
-        self.device = usb.core.find(idVendor=VENDOR_ID, idProduct=PRODUCT_ID)
-        self.connect_usb()
+        self.inflight = inflight
+        self.workers = workers
+        self.pool = None
+        self.frameMemory = None
+        self.headless = headless
+        self.capture = capture
+        self.solidTiles = {}
+        # Held while frames are sent, so a hot-plug reconnect never interleaves with a render
+        self.lock = threading.RLock()
         self.imagePath = None
         self.objects:LCDObject = []
 
         if isVertical:
             self.width,self.height=170,320
-            self.imageBuffer = Image.effect_noise([self.width,self.height],0.5).convert("RGBA")
             self.imageBuffer = Image.new("RGBA",[self.width,self.height],(0,0,0,100))
-            self.textBuffer = Image.new("RGBA", [self.width, self.height], (0, 0, 0, 100))
+            self.textFill = (0, 0, 0, 100)
+            self.textBuffer = Image.new("RGBA", [self.width, self.height], self.textFill)
             self.d_width, self.d_height = d_width, d_height
         else:
             self.width,self.height=320,170
-            self.imageBuffer = Image.effect_noise([self.width,self.height],0.5).convert("RGBA")
             self.imageBuffer = Image.new("RGBA",[self.width,self.height],(0,0,0,0))
-            self.textBuffer = Image.new("RGBA", [self.width, self.height], (0, 0, 0, 0))
+            self.textFill = (0, 0, 0, 0)
+            self.textBuffer = Image.new("RGBA", [self.width, self.height], self.textFill)
             self.d_width, self.d_height = d_height, d_width
         
-        self.h_blocks = int(self.width / self.d_width)        
-        self.v_blocks = int(self.height / self.d_height)
         print(f"INIT WIDTH {self.width} DWIDTH {self.d_width} HEIGHT {self.height} DHEIGHT {self.d_height}")
         self.isVertical:bool = isVertical
 
-        self.orient()
-        self.scheduler = sched.scheduler(time.time, time.sleep)
-        self.dirty_rects = [[0 for x in range(self.h_blocks)] for y in range(self.v_blocks)] 
+        # Tile size and grid as seen by the device, which is always 320x170. When the tile size does
+        # not divide the panel the last column and row hold cut down tiles
+        if isVertical: self.tile_w, self.tile_h = self.d_height, self.d_width
+        else: self.tile_w, self.tile_h = self.d_width, self.d_height
+        if not tile_fits(self.tile_w, self.tile_h):
+            raise ValueError(f"Tile {self.tile_w}x{self.tile_h} does not fit a {TILE_PAYLOAD_SIZE} byte 0xA2 payload")
+        self.dirty = TileMap(-(-PANEL_WIDTH // self.tile_w), -(-PANEL_HEIGHT // self.tile_h))
         self.mark_all_dirty()
 
         print(f"INIT IBUFF => {self.imageBuffer.size} TBUFF => {self.textBuffer.size} ")
-        
+        self.journal = None
+        if journal is not None:
+            self.journal = PanelJournal(journal, isVertical, self.dirty.cols, self.dirty.rows)
+        if not lazy: self.connect()
+
+    def connect(self):
+        """
+        Finds the device, opens the OUT endpoint and sends the orientation packet.
+        Called on the first render when the instance was created lazily.
+        """
+        if self.stale:
+            # After a lost connection the panel may have been power cycled: nothing recorded holds
+            # and whichever path reconnects, the whole frame is replayed
+            if self.journal is not None: self.journal.reset()
+            self.mark_all_dirty()
+        if self.headless:
+            if not isinstance(self.endpoint, OffscreenPanel):
+                self.endpoint = OffscreenPanel(self.capture)
+            self.attach_writer()
+        else:
+            self.device = find_tft(refresh=self.stale)
+            self.connect_usb()
+        self.stale = False
+        self.orient()
+
+    def disconnect(self):
+        """
+        Drops the endpoint after the device went away. The next render reconnects.
+        """
+        with self.lock:
+            if self.writer is not None:
+                self.writer.close()
+            self.writer = None
+            if not self.headless: self.endpoint = None
+            self.device = None
+            # The cached device handle is no longer valid once it was unplugged
+            self.stale = True
+
+    def close(self):
+        """
+        Stops the writer and the encoding workers and closes the journal, for when the display is
+        dropped, for instance after a layout rebuild. Nothing is sent afterwards.
+        """
+        with self.lock:
+            self.disconnect()
+            if self.pool is not None:
+                self.pool.shutdown()
+                self.pool = None
+                self.frameMemory.close()
+                self.frameMemory.unlink()
+                self.frameMemory = None
+            if self.journal is not None:
+                self.journal.close()
+                self.journal = None
+
+    def reconnect(self):
+        """
+        Connects to a freshly plugged in device and resends the orientation. When the device was
+        connected before, the whole current frame is replayed since the panel lost its content;
+        a first connect keeps the journal and only sends what the panel does not show yet.
+        """
+        with self.lock:
+            if self.writer is not None: self.disconnect()
+            self.connect()
+            self.render()
+
     def connect_usb(self):
         """
 
@@ -322,6 +996,7 @@ class S1TFT:
         """
         if self.device is None:
             raise ValueError('Device not found')
+        import usb.util
         # get an endpoint instance
         cfg = self.device.get_active_configuration()
         intf = cfg[(1, 0)]
@@ -333,8 +1008,25 @@ class S1TFT:
                 usb.util.endpoint_direction(e.bEndpointAddress) == \
                 usb.util.ENDPOINT_OUT)
         # print(self.endpoint)
+        self.attach_writer()
         return (self.endpoint)
 
+    def attach_writer(self):
+        """
+        Creates the tile writer for the current endpoint.
+        """
+        if self.writer is not None: self.writer.close()
+        self.writer = TileWriter(self.endpoint, self.inflight)
+        if self.journal is not None:
+            self.writer.onSent = self.tile_sent
+            self.writer.onFailed = self.tile_failed
+
+    def tile_sent(self, packet:TilePacket):
+        if packet.tag is not None: self.journal.record(*packet.tag)
+
+    def tile_failed(self, packet:TilePacket):
+        if packet.tag is not None: self.journal.forget(packet.tag[0])
+
     def orient(self):
         """
 
@@ -345,30 +1037,123 @@ class S1TFT:
         command_v = [85, 161, 241, 2 , 0, 0, 0, 0 ]
         if not self.isVertical: command_x = command_h 
         else: command_x = command_v
-        buffer = [0] * 4096
         if self.isVertical : print("ORIENTATION VERTICAL")
         else : print("ORIENTATION HORIZONTAL")
-        bcommand = bytearray (command_x)
-        bbuffer = bytearray (buffer)
-        final_ba = bcommand + bbuffer
-        self.endpoint.write(final_ba)
+        packet = self.writer.acquire()
+        packet.command(command_x)
+        self.writer.submit(packet)
+        self.writer.flush()
 
     def black(self):
         """
         """
-        print(f"Image size {self.imageBuffer.size}   Text Buffer { self.textBuffer.size }")
-        self.imageBuffer =self.textBuffer = Image.new("RGBA",self.imageBuffer.size,(0,0,0,255))
-        self.mark_all_dirty()
-        self.render()
+        self.fill((0,0,0))
 
     def white(self):
         """
         """
-        print(f"Image size {self.imageBuffer.size}   Text Buffer { self.textBuffer.size }")
-        self.imageBuffer =self.textBuffer = Image.new("RGBA",self.imageBuffer.size,(255,255,255,255))
-        self.mark_all_dirty()
-        self.render()
+        self.fill((255,255,255))
+
+    def blank(self):
+        """
+        Blanks the whole panel at once, e.g. for a display off schedule.
+        """
+        self.fill((0,0,0))
 
+    def solid_tile(self, color, w:int, h:int) -> bytes:
+        """
+        Args:
+            color (tuple): RGB colour
+            w (int): tile width
+            h (int): tile height
+
+        Returns:
+            bytes: RGB565 payload of one w x h tile in that colour, built once per colour and size
+        """
+        data = self.solidTiles.get((color, w, h))
+        if data is None:
+            data = self.rgb888_to_rgb565(*color).to_bytes(2, "big") * (w * h)
+            self.solidTiles[(color, w, h)] = data
+        return data
+
+    def tile_box(self, col:int, row:int) -> tuple:
+        """
+        Args:
+            col (int): device tile column
+            row (int): device tile row
+
+        Returns:
+            tuple: device x, y, width and height of the tile, cut down to the panel on the last column and row
+        """
+        x, y = col * self.tile_w, row * self.tile_h
+        return x, y, min(self.tile_w, PANEL_WIDTH - x), min(self.tile_h, PANEL_HEIGHT - y)
+
+    def tile_window(self, bounds) -> tuple:
+        """
+        Grows a rectangle of the screen to the device tiles under it, so redrawing the rectangle
+        repaints whole tiles and nothing around them.
+
+        Args:
+            bounds (tuple): x1, y1, x2, y2 in screen coordinates, x2 and y2 exclusive
+
+        Returns:
+            tuple: x1, y1, x2, y2 of the covering tiles in screen coordinates, x2 and y2 exclusive
+        """
+        x1, y1, x2, y2 = bounds
+        # Clipped to the screen, a rectangle off its edge keeps the nearest tile
+        x1, y1 = min(max(0, x1), self.width - 1), min(max(0, y1), self.height - 1)
+        x2, y2 = min(max(x1 + 1, x2), self.width), min(max(y1 + 1, y2), self.height)
+        if self.isVertical: dx1, dy1, dx2, dy2 = y1, self.width - x2, y2, self.width - x1
+        else: dx1, dy1, dx2, dy2 = x1, y1, x2, y2
+        dx1, dy1, w, h = self.tile_box(dx1 // self.tile_w, dy1 // self.tile_h)
+        x, y, w, h = self.tile_box((dx2 - 1) // self.tile_w, (dy2 - 1) // self.tile_h)
+        dx2, dy2 = x + w, y + h
+        if self.isVertical: return self.width - dy2, dx1, self.width - dy1, dx2
+        return dx1, dy1, dx2, dy2
+
+    def fill(self, color, bounds = None):
+        """
+        Fills a rectangle of the screen with a solid colour. Tiles the rectangle fully covers are
+        sent as one precomputed payload replayed across them, with no compositing or per pixel
+        encoding; only tiles on its edges go through the normal render.
+
+        Args:
+            color (tuple): RGB colour
+            bounds (tuple, optional): x1, y1, x2, y2 in screen coordinates, x2 and y2 exclusive. Defaults to the whole screen.
+        """
+        color = tuple(color[:3])
+        x1, y1, x2, y2 = bounds if bounds is not None else (0, 0, self.width, self.height)
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(self.width, x2), min(self.height, y2)
+        if x1 >= x2 or y1 >= y2: return
+        # The text buffer is left empty like `erase` does, so the panel shows the colour under the
+        # empty text fill, which dims it in vertical mode. The fast path sends what a render would
+        shown = Image.alpha_composite(Image.new("RGBA", (1, 1), color + (255,)),
+                                      Image.new("RGBA", (1, 1), self.textFill)).getpixel((0, 0))[:3]
+        with self.lock:
+            self.imageBuffer.paste(color + (255,), (x1, y1, x2, y2))
+            self.textBuffer.paste(self.textFill, (x1, y1, x2, y2))
+
+            # The same rectangle in device coordinates, the screen is rotated by 90 degrees when vertical
+            if self.isVertical: dx1, dy1, dx2, dy2 = y1, self.width - x2, y2, self.width - x1
+            else: dx1, dy1, dx2, dy2 = x1, y1, x2, y2
+            w, h = self.tile_w, self.tile_h
+            # Reaching the panel edge covers the cut down tiles of the last column and row too
+            col1 = self.dirty.cols - 1 if dx2 == PANEL_WIDTH else dx2 // w - 1
+            row1 = self.dirty.rows - 1 if dy2 == PANEL_HEIGHT else dy2 // h - 1
+            full = TileMap(self.dirty.cols, self.dirty.rows)
+            full.mark_rect(-(-dx1 // w), -(-dy1 // h), col1, row1)
+
+            self.mark_dirty((x1, y1, x2 - 1, y2 - 1))
+            self.dirty.bits &= ~full.bits
+            if not self.ensure_connected():
+                self.dirty.union(full)
+                return
+            with self.send_frame():
+                for col, row in full.tiles():
+                    x, y, tw, th = self.tile_box(col, row)
+                    self.send_encoded(self.solid_tile(shown, tw, th), col, row)
+                self.render_dirty()
 
     def rgb888_to_rgb565(self,r: int, g: int  , b:int):
         """
@@ -392,19 +1177,7 @@ class S1TFT:
         Returns:
             [type]: [description]
         """
-        if image.format != "RGB": image = image.convert("RGB")
-        height, width = image.size
-
-        bx = bytearray(height * width * 2)
-        i = 0 
-        for y in range(0, width):
-            for x in range(0, height): 
-                r, g, b = image.getpixel((x, y))
-                rgb565 = self.rgb888_to_rgb565(r, g, b).to_bytes(2, "big")
-                bx[i] = rgb565[0]
-                bx[i + 1] = rgb565[1]            
-                i += 2
-        return (bx)
+        return bytearray(encode_rgb565(image))
 
     def part_updatei(self, image:Image, x:int, y:int, w:int, h:int):
         """
@@ -415,154 +1188,256 @@ class S1TFT:
             w (int): [description]
             h (int): [description]
         """
-        start_time = time.time()
-        if ((w * h) > 2080): return
-        bcommand = bytearray()
-        bcommand.append(0x55)
-        bcommand.append(0xA2)
-        bcommand[2:3] = (int(x).to_bytes(2, byteorder='little'))  # Offset
-        bcommand[4:5] = (int(y).to_bytes(2, byteorder='little'))  # Length
-        bcommand.append(w)
-        bcommand.append(h)
-        bbuffer = self.convert_image_to_rgb565_part(image)
-        if (len(bbuffer) < 4096): 
-            bbuffer += bytes(4096 - len(bbuffer))                
-        final_ba = bcommand + bbuffer
+        if ((w * h * 2) > TILE_PAYLOAD_SIZE): return
+        packet = self.writer.acquire()
         try:
-            self.endpoint.write(final_ba)
-        except:
-            pass
+            packet.fill(image, int(x), int(y), w, h)
+        except Exception:
+            # The pool is small, a packet lost here would block the next acquire for good
+            self.writer.release(packet)
+            raise
+        self.submit_packet(packet, int(x), int(y), w, h)
+
+    def send_encoded(self, data:bytes, col:int, row:int):
+        """
+        Sends a tile that is already RGB565 encoded, such as a precomputed page tile.
+
+        Args:
+            data (bytes): RGB565 payload of one tile
+            col (int): device tile column
+            row (int): device tile row
+        """
+        x, y, w, h = self.tile_box(col, row)
+        packet = self.writer.acquire()
+        try:
+            packet.fill_encoded(data, x, y, w, h)
+        except Exception:
+            self.writer.release(packet)
+            raise
+        self.submit_packet(packet, x, y, w, h)
+
+    def submit_packet(self, packet:TilePacket, x:int, y:int, w:int, h:int):
+        """
+        Hands a filled packet to the writer, unless the journal shows the panel already has it.
+        """
+        if self.journal is not None:
+            index = (y // self.tile_h) * self.journal.cols + x // self.tile_w
+            digest = packet.digest()
+            if self.journal.matches(index, digest):
+                self.writer.release(packet)
+                return
+            packet.tag = (index, digest)
+        self.writer.submit(packet)
+
+    def force_full_refresh(self):
+        """
+        Sends every tile again regardless of the journal, for when the panel was power cycled.
+        """
+        if self.journal is not None: self.journal.reset()
+        self.mark_all_dirty()
+        self.render()
 
     def print_dirty_set(self):
         """
         """
-        pprint(self.dirty_rects)
+        print(self.dirty)
 
     def mark_all_dirty(self):
         """
         """
-        for i in range(self.h_blocks):
-            for j in range(self.v_blocks):
-                self.dirty_rects[j][i] += 1
+        self.dirty.mark_all()
 
     def mark_all_clean(self):
         """
         """
-        for i in range(self.h_blocks):
-            for j in range(self.v_blocks):
-                self.dirty_rects[j][i] = 0
+        self.dirty.clear()
 
     def mark_dirty(self,bounds):
-        x1,y1,x2,y2=bounds
-        # If we are horizontal then the coordinates need   to be flipped
+        """
+        Marks the tiles under a rectangle given in screen coordinates.
 
-        # print(f"x1 y1  x2  y2 :: {bounds}")
+        Args:
+            bounds (tuple): x1, y1, x2, y2 as returned by `textbbox`
+        """
+        x1,y1,x2,y2=bounds
         min_x = max(0, min(x1, x2))
-        max_x = min(self.height - 1, max(x1, x2))
+        max_x = min(self.width - 1, max(x1, x2))
         min_y = max(0, min(y1, y2))
-        max_y = min(self.width - 1 , max(y1, y2))
-
-        if not self.isVertical:
-            max_x = min(self.width - 1, max(x1, x2))
-            max_y = min(self.height - 1 , max(y1, y2))
-        else:
-            max_x = min(self.width - 1, max(x1, x2))
-            max_y = min(self.height  - 1 , max(y1, y2))
-
-        # print(f" minX:{min_x} maxX:{max_x}  || minY:{min_y} maxY:{max_y} || W-{self.d_width} H-{self.d_height} ")
-
-        if not self.isVertical:
-            start_x = math.floor( min_x // self.d_width )
-            end_x = math.ceil ( max_x // self.d_width )
-            start_y = math.floor( min_y // self.d_height)
-            end_y = math.ceil(max_y // self.d_height )
-        else:
-            start_x = math.floor( min_x // self.d_width )
-            end_x = math.ceil ( max_x // self.d_width )
-            start_y = math.floor( min_y // self.d_height)
-            end_y = math.ceil(max_y // self.d_height )
-
-        # print(f" startX:{start_x} endX:{end_x}  || startY:{start_y} endY:{end_y}")        
+        max_y = min(self.height - 1 , max(y1, y2))
+        if min_x > max_x or min_y > max_y: return
 
         if self.isVertical :
-            for j in range(start_x, end_x + 1):
-                for i in range(start_y, end_y + 1  ):
-                    self.dirty_rects[i][self.h_blocks - j -1 ] += 1
+            # The screen is the device rotated by 90 degrees: screen y runs along device x
+            # and screen x runs against device y
+            dx1, dy1, dx2, dy2 = min_y, self.width - 1 - max_x, max_y, self.width - 1 - min_x
         else :
-            for j in range(start_x, end_x + 1):
-                for i in range(start_y, end_y + 1 ):
-                    # print(f"I={i} J={j}")
-                    self.dirty_rects[i][j] += 1
+            dx1, dy1, dx2, dy2 = min_x, min_y, max_x, max_y
+        self.dirty.mark_rect(int(dx1 // self.tile_w), int(dy1 // self.tile_h),
+                             int(dx2 // self.tile_w), int(dy2 // self.tile_h))
 
-    def load_image(self, imageName:str):
+    def fit_image(self, image:Image) -> Image:
         """
-
         Args:
-            imageName (str): [description]
+            image (Image): any image
+
+        Returns:
+            Image: the image as RGBA at screen size, rotated or resized when needed
         """
-        print(f" Image name  : {(imageName)} Vertical:{self.isVertical} Width:{self.width} Height:{self.height}")
-        image = Image.open(imageName)         
         print(f"Image size :: {image.size}")   
         if image.size == (self.width,self.height):            
             print("Image dimensions match")
-            self.imageBuffer = image.convert("RGBA")            
+            return image.convert("RGBA")            
         elif image.size == (self.height,self.width):            
             print("Image is rotated")
-            self.imageBuffer = image.rotate(90,expand=True).convert("RGBA")            
+            return image.rotate(90,expand=True).convert("RGBA")            
         else:
             print("Image resized")
-            self.imageBuffer = image.resize((self.width, self.height), Image.Resampling.LANCZOS).convert("RGBA")
+            return image.resize((self.width, self.height), Image.Resampling.LANCZOS).convert("RGBA")
 
-        self.imageBuffer.save(f"{imageName}writtenX.png", "PNG")
+    def load_image(self, imageName:str):
+        """
+
+        Args:
+            imageName (str): [description]
+        """
+        print(f" Image name  : {(imageName)} Vertical:{self.isVertical} Width:{self.width} Height:{self.height}")
+        self.imageBuffer = self.fit_image(Image.open(imageName))
 
         print(f" IBUFF => {self.imageBuffer.size} TBUFF => {self.textBuffer.size} ")        
         self.mark_all_dirty()
 
+    def clear_image(self):
+        """
+        Drops the background image, back to the blank frame the display starts with.
+        """
+        self.imageBuffer = Image.new("RGBA", [self.width, self.height], (0, 0, 0, 100) if self.isVertical else (0, 0, 0, 0))
+        self.mark_all_dirty()
+
 
-    def render_when_vertical(self, simulate:bool = False):
+    def render_tiles(self, textImage:Image, bgImage:Image, simulate:bool = False):
+        """
+        Sends every dirty tile, in send order, composited from buffers already in device orientation.
+
+        Args:
+            textImage (Image): text buffer, 320x170
+            bgImage (Image): image buffer, 320x170
+            simulate (bool, optional): send one random colour instead of the content. Defaults to False.
+        """
         r,g,b=random.randint(0,255),random.randint(0,255),random.randint(0,255)
+        tiles = self.dirty.take()
+        if self.workers > 0 and not simulate and len(tiles) >= PARALLEL_MIN_TILES:
+            self.render_tiles_parallel(textImage, bgImage, tiles)
+            return
+        for col, row in tiles:
+            x1, y1, w, h = self.tile_box(col, row)
+            box = [x1, y1, x1 + w, y1 + h]
+            tmpImage = Image.alpha_composite(bgImage.crop(box), textImage.crop(box))
+            if simulate : tmpImage = Image.new("RGBA", tmpImage.size,(r,g,b))
+            self.part_updatei(tmpImage, x1, y1, w, h)
+
+    def render_tiles_parallel(self, textImage:Image, bgImage:Image, tiles:list):
+        """
+        Composites the frame once into shared memory, encodes each device row of tiles on the
+        worker processes and sends the results in tile order as the rows complete. Processes
+        rather than threads, since each tile is a handful of small Pillow calls that hold the GIL.
+
+        Args:
+            textImage (Image): text buffer, 320x170
+            bgImage (Image): image buffer, 320x170
+            tiles (list): (col, row) tiles in send order
+        """
+        size = PANEL_WIDTH * PANEL_HEIGHT * 4
+        if self.pool is None:
+            self.frameMemory = shared_memory.SharedMemory(create=True, size=size)
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        self.frameMemory.buf[:size] = Image.alpha_composite(bgImage, textImage).tobytes()
+        bands = {}
+        for col, row in tiles:
+            bands.setdefault(row, []).append(col)
+        futures = [self.pool.submit(encode_shared_band, self.frameMemory.name, [self.tile_box(col, row) for col in cols])
+                   for row, cols in bands.items()]
+        for (row, cols), future in zip(bands.items(), futures):
+            for col, data in zip(cols, future.result()):
+                self.send_encoded(data, col, row)
+
+    def render_when_vertical(self, simulate:bool = False):
         start_time = time.time_ns()
-        for i in range(0,self.height,self.d_height):
-            for j in range(0,self.width,self.d_width):
-                x1,y1,x2,y2= i,j,i+self.d_height,j+self.d_width    
-                x_index, y_index = int(i/self.d_height),int(j/self.d_width)
-                if ( self.dirty_rects[x_index][y_index] > 0):
-                    txtImage = (self.textBuffer.transpose(Image.Transpose.ROTATE_90)).crop([x1,y1,x2,y2])
-                    tmpImage = (self.imageBuffer.transpose(Image.Transpose.ROTATE_90)).crop([x1,y1,x2,y2])
-                    tmpImage = Image.alpha_composite(tmpImage,txtImage)
-                    if simulate : tmpImage = Image.new("RGBA", tmpImage.size,(r,g,b))
-                    self.part_updatei(tmpImage, i,j,self.d_height,self.d_width)
-                    self.dirty_rects[x_index][y_index] -=1
+        if self.dirty:
+            self.render_tiles(self.textBuffer.transpose(Image.Transpose.ROTATE_90),
+                              self.imageBuffer.transpose(Image.Transpose.ROTATE_90), simulate)
         print(f"\t\t-> RWV time is {((time.time_ns() - start_time)/1000000):10.2f}ms")
 
     def render_when_horizontal(self, simulate:bool = False):
-        r,g,b=random.randint(0,255),random.randint(0,255),random.randint(0,255)
         start_time = time.time_ns()
-        for i in range(0,self.width,self.d_width):
-            for j in range(0,self.height,self.d_height):    
-                x1,y1,x2,y2= i,j,i+self.d_width,j+self.d_height
-                x_index, y_index = int(j/self.d_height),int(i/self.d_width)                
-                if ( self.dirty_rects[x_index][y_index] > 0):
-                    txtImage = self.textBuffer.crop([x1,y1,x2,y2])   
-                    tmpImage = self.imageBuffer.crop([x1,y1,x2,y2])   
-                    tmpImage = Image.alpha_composite(txtImage,tmpImage)
-                    if simulate : tmpImage = Image.new("RGBA", tmpImage.size,(r,g,b))
-                    self.part_updatei(tmpImage, x1,y1,x2-x1,y2-y1)
-                    self.dirty_rects[x_index][y_index] -=1
+        if self.dirty:
+            self.render_tiles(self.textBuffer, self.imageBuffer, simulate)
         print(f"\t\t-> RWH time is {((time.time_ns() - start_time)/1000000):10.2f}ms")
 
-    def render(self, simulate:bool = False):
+    def ensure_connected(self) -> bool:
+        """
+        Returns:
+            bool: True when connected, connecting first if needed
+        """
+        if self.writer is not None: return True
+        import usb.core
+        try:
+            self.connect()
+        except (ValueError, usb.core.USBError) as e:
+            print(f"Device not available: {e}")
+            return False
+        return True
+
+    @contextlib.contextmanager
+    def send_frame(self):
+        """
+        Groups the tiles sent inside the block into one frame: on leaving it the writer is flushed
+        and, when any of them was lost, the display disconnects and is marked dirty for a full replay.
+        Everything sent outside of `render` itself, such as precomputed tiles, goes through it too,
+        so their failures are counted. Must be entered connected, with the lock held.
+        """
+        failed = self.writer.failed
+        yield
+        self.writer.flush()
+        if self.headless: self.endpoint.capture_frame()
+        if self.writer.failed > failed:
+            # Part of the frame never reached the panel, start over with a full replay
+            print(f"Lost {self.writer.failed - failed} tiles, reconnecting on next render")
+            self.disconnect()
+            self.mark_all_dirty()
+
+    def render_dirty(self, simulate:bool = False):
+        """
+        Sends the dirty tiles, inside a `send_frame` block.
+        """
         if self.isVertical:
             self.render_when_vertical(simulate)
         else :
             self.render_when_horizontal(simulate)
 
+    def render(self, simulate:bool = False):
+        with self.lock:
+            # Keep the tiles dirty when there is no device, they are sent once it shows up
+            if not self.ensure_connected(): return
+            with self.send_frame():
+                self.render_dirty(simulate)
+
     def drawObjects(self):
+        """
+        Redraws every object. What each object drew last time is erased first, so shorter text
+        leaves nothing behind, and only the tiles where the text buffer actually changed, inside
+        the old and new bounds of each object, are marked dirty.
+        """
+        before = self.textBuffer.copy()
+        previous = [obj.bounds for obj in self.objects]
+        # Erase everything before drawing anything, so overlapping objects do not wipe each other
+        for bounds in previous:
+            if bounds is not None: self.erase(bounds)
         for obj in self.objects:
-            x,y = obj.x, obj.y
-            self.textBuffer, bounds= obj.draw(self.imageBuffer, self.textBuffer)
-            self.mark_dirty(bounds)  
-        self.textBuffer.save("renTxtBuf.png")          
+            self.textBuffer, obj.bounds = obj.draw(self.imageBuffer, self.textBuffer)
+        for obj, old in zip(self.objects, previous):
+            region = obj.bounds if old is None else (min(old[0], obj.bounds[0]), min(old[1], obj.bounds[1]),
+                                                     max(old[2], obj.bounds[2]), max(old[3], obj.bounds[3]))
+            self.mark_changed(before, region)
 
     def renderALL(self):
         """renderTime
@@ -574,11 +1449,48 @@ class S1TFT:
         self.timeCounter+=1 
 
     def addObject(self, obj:LCDObject):
+        obj.attach(self)
         self.objects.append(obj)
 
+    def removeObject(self, obj:LCDObject):
+        """
+        Removes an object and erases whatever it drew last, only the tiles under it are repainted.
+
+        Args:
+            obj (LCDObject): object previously passed to `addObject`
+        """
+        self.objects.remove(obj)
+        if obj.bounds is not None:
+            self.erase(obj.bounds)
+            self.mark_dirty(obj.bounds)
+            obj.bounds = None
+
+    def erase(self, bounds):
+        """
+        Restores the empty text buffer under bounds, inclusive like the widget backgrounds.
+        """
+        ImageDraw.Draw(self.textBuffer).rectangle(bounds, fill=self.textFill)
+
+    def mark_changed(self, before:Image, bounds):
+        """
+        Marks dirty only the part of bounds where the text buffer differs from before.
+
+        Args:
+            before (Image): copy of the text buffer taken before drawing
+            bounds (tuple): x1, y1, x2, y2 inclusive
+        """
+        x1, y1 = max(0, int(bounds[0])), max(0, int(bounds[1]))
+        x2, y2 = min(self.width, int(bounds[2]) + 1), min(self.height, int(bounds[3]) + 1)
+        if x1 >= x2 or y1 >= y2: return
+        box = (x1, y1, x2, y2)
+        changed = ImageChops.difference(before.crop(box), self.textBuffer.crop(box)).getbbox()
+        if changed is not None:
+            self.mark_dirty((x1 + changed[0], y1 + changed[1], x1 + changed[2] - 1, y1 + changed[3] - 1))
+
     def startScheduler(self):
         """startScheduler
         """
+        if self.scheduler is None: self.scheduler = sched.scheduler(time.time, time.sleep)
         self.scheduler.enterabs(time.time() + 1, 1000, self.renderALL)
         self.scheduler.run()        
 
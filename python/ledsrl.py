@@ -28,12 +28,21 @@ import logging
 # ---------------------------------------------------------------------------
 
 # ---------------------------------------------------------------------------
-date_stamp = datetime.datetime.now().strftime("%Y-%m-%d_%H%M%S")
 logger = logging.getLogger(__name__)
-logging.basicConfig( encoding='utf-8', level=logging.DEBUG,     handlers=[
-        logging.FileHandler(f'led_srl_{date_stamp}.log'),
-        logging.StreamHandler()
-    ])
+
+def setup_logging():
+    '''
+    Configures logging to the console and a timestamped log file.
+    Only called when run as a script, so importing this module creates no files.
+            Parameters: None
+            Returns:
+                    None
+    '''
+    date_stamp = datetime.datetime.now().strftime("%Y-%m-%d_%H%M%S")
+    logging.basicConfig( encoding='utf-8', level=logging.DEBUG,     handlers=[
+            logging.FileHandler(f'led_srl_{date_stamp}.log'),
+            logging.StreamHandler()
+        ])
 # ---------------------------------------------------------------------------
 
 
@@ -103,8 +112,8 @@ def probe_led_interface():
         if (device.vid != None and  device.pid != None and device.vid == VID and device.pid== PID ):
             logger.debug(f"Detected device at {device.name}")
             dev_name = device.name
-        else:
-            logger.error(f"Device not Detected")
+    if dev_name is None:
+        logger.error(f"Device not Detected")
     return (dev_name)
 
 
@@ -191,6 +200,7 @@ def cleanup(sDev):
 # ---------------------------------------------------------------------------
 # ---------------------------------------------------------------------------
 def main():
+    setup_logging()
     deviceHandle = probe_led_interface()
     logger.debug (f"Device handle : {deviceHandle} ")
 
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+""" Page rotation for the Acemagic S1 TFT.
+This program is free software: you can redistribute it under
+the terms of the GNU General Public License as published by the Free Software
+Foundation, either version 3 of the License.
+This program is distributed in the hope that it will be useful, but WITHOUT
+ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+FOR A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+You should have received a copy of the GNU General Public License along with
+this program. If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import sched
+import time
+
+from PIL import Image
+
+import lcddsp
+
+# The `LCDPage` class is one dashboard page: a background, widgets that never change once drawn and
+# widgets that are redrawn every tick. The static part is composited and RGB565 encoded per tile once,
+# when the page is added to a `PageManager`.
+class LCDPage:
+    def __init__(self, name:str, background = None, static:list = (), dynamic:list = ()):
+        """
+        Args:
+            name (str): page name used by `PageManager.show`
+            background (str or Image, optional): background image or its file name. Defaults to None.
+            static (list, optional): objects drawn once into the page frame. Defaults to ().
+            dynamic (list, optional): objects redrawn every tick while the page is shown. Defaults to ().
+        """
+        self.name = name
+        self.background = background
+        self.static = list(static)
+        self.dynamic = list(dynamic)
+        self.frame = None
+        self.tiles = None
+
+    def prepare(self, tft:lcddsp.S1TFT):
+        """
+        Composites the background and static objects into `frame` and encodes every tile of it,
+        as the panel would show it under an empty text buffer, into `tiles`.
+
+        Args:
+            tft (S1TFT): display the page is shown on
+        """
+        if self.background is None:
+            frame = Image.new("RGBA", (tft.width, tft.height), (0, 0, 0, 255))
+        elif isinstance(self.background, str):
+            frame = tft.fit_image(Image.open(self.background))
+        else:
+            frame = tft.fit_image(self.background)
+        layer = Image.new("RGBA", frame.size, (0, 0, 0, 0))
+        for obj in self.static:
+            obj.attach(tft)
+            layer, bounds = obj.draw(frame, layer)
+        self.frame = Image.alpha_composite(frame, layer)
+        for obj in self.dynamic:
+            obj.attach(tft)
+
+        shown = Image.alpha_composite(self.frame, Image.new("RGBA", frame.size, tft.textFill))
+        if tft.isVertical: shown = shown.transpose(Image.Transpose.ROTATE_90)
+        self.tiles = {}
+        for row in range(tft.dirty.rows):
+            for col in range(tft.dirty.cols):
+                x, y, w, h = tft.tile_box(col, row)
+                self.tiles[(col, row)] = lcddsp.encode_rgb565(shown.crop([x, y, x + w, y + h]))
+
+# The `PageManager` class switches a display between pages. A switch only sends the tiles where the
+# incoming page differs from what the panel shows, straight from the precomputed tiles, and repaints
+# the incoming page's dynamic objects through the normal dirty tile render.
+class PageManager:
+    def __init__(self, tft:lcddsp.S1TFT):
+        """
+        Args:
+            tft (S1TFT): display to drive
+        """
+        self.tft = tft
+        self.pages = []
+        self.current = None
+        self.scheduler = None
+
+    def add(self, page:LCDPage):
+        page.prepare(self.tft)
+        self.pages.append(page)
+
+    def get(self, name:str) -> LCDPage:
+        for page in self.pages:
+            if page.name == name: return page
+        raise ValueError(f"No page named {name}")
+
+    def show(self, name:str):
+        """
+        Switches to a page.
+
+        Args:
+            name (str): page to show
+        """
+        tft = self.tft
+        incoming = self.get(name)
+        outgoing = self.current
+        with tft.lock:
+            changed = lcddsp.TileMap(tft.dirty.cols, tft.dirty.rows)
+            if outgoing is None:
+                changed.mark_all()
+            else:
+                for tile, data in incoming.tiles.items():
+                    if outgoing.tiles[tile] != data: changed.mark(*tile)
+                # The panel still shows what the outgoing dynamic objects drew last
+                tft.mark_all_clean()
+                for obj in tft.objects:
+                    if obj.bounds is not None: tft.mark_dirty(obj.bounds)
+                changed.union(tft.dirty)
+
+            tft.imageBuffer = incoming.frame.copy()
+            tft.textBuffer = Image.new("RGBA", incoming.frame.size, tft.textFill)
+            tft.objects = list(incoming.dynamic)
+            for obj in tft.objects: obj.bounds = None
+            self.current = incoming
+
+            # Tiles under dynamic objects go through the normal render, the rest are precomputed
+            tft.mark_all_clean()
+            tft.drawObjects()
+            changed.bits &= ~tft.dirty.bits
+            if not tft.ensure_connected():
+                tft.dirty.union(changed)
+                return
+            with tft.send_frame():
+                for col, row in changed.take():
+                    tft.send_encoded(incoming.tiles[(col, row)], col, row)
+                tft.render_dirty()
+
+    def next(self):
+        """
+        Shows the page after the current one.
+        """
+        index = 0 if self.current is None else (self.pages.index(self.current) + 1) % len(self.pages)
+        self.show(self.pages[index].name)
+
+    def tick(self):
+        self.scheduler.enterabs(time.time() + 1, 1000, self.tick)
+        self.tft.drawObjects()
+        self.tft.render()
+
+    def rotate(self):
+        self.scheduler.enterabs(time.time() + self.interval, 100, self.rotate)
+        self.next()
+
+    def run(self, interval:float = 10.0):
+        """
+        Rotates through the pages, redrawing the dynamic objects every second.
+
+        Args:
+            interval (float, optional): seconds each page is shown. Defaults to 10.0.
+        """
+        self.interval = interval
+        self.scheduler = sched.scheduler(time.time, time.sleep)
+        self.next()
+        self.scheduler.enterabs(time.time() + 1, 1000, self.tick)
+        self.scheduler.enterabs(time.time() + interval, 100, self.rotate)
+        self.scheduler.run()
+
+
+def main():
+    """main
+    """
+    tft = lcddsp.S1TFT(34, 40, True, lazy=True)
+    manager = PageManager(tft)
+    manager.add(LCDPage("system", "../images/a4.jpg",
+                        static=[lcddsp.LCDText(10, 120, "SYSTEM", fontSize=28)],
+                        dynamic=[lcddsp.LCDTime(10, 0, fontSize=34, textColor=(255, 255, 0)),
+                                 lcddsp.LCDCPUutil(10, 240, fontSize=24)]))
+    manager.add(LCDPage("clock", "../images/a1.jpg",
+                        dynamic=[lcddsp.LCDTime(10, 0, fontSize=34, textColor=(255, 255, 0)),
+                                 lcddsp.LCDDate(0, 40, fontSize=22)]))
+    manager.run()
+
+if __name__ == "__main__":
+    """ Launcher
+    """
+    main()
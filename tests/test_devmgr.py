@@ -0,0 +1,48 @@
+import pytest
+
+pytest.importorskip("PIL")
+pytest.importorskip("usb.core")
+pytest.importorskip("serial")
+
+import devmgr
+import lcddsp
+
+
+def test_replug_noticed_by_poll_replays_the_frame(monkeypatch):
+    present = True
+    monkeypatch.setattr(devmgr, "tft_present", lambda: present)
+    tft = lcddsp.S1TFT(34, 40, True, headless=True)
+    tft.fill((0, 0, 255))
+    tft.addObject(lcddsp.LCDText(10, 0, "A", fontSize=20))
+    manager = devmgr.DeviceManager(tft, led=False)
+    manager.poll()
+
+    present = False
+    manager.poll()
+    assert tft.writer is None
+
+    # The panel comes back blank and a render tick reconnects before the next poll
+    panel = tft.endpoint
+    panel.framebuffer[:] = bytes(len(panel.framebuffer))
+    tft.drawObjects()
+    tft.render()
+    present = True
+    manager.poll()
+
+    blank = panel.image().getcolors(lcddsp.PANEL_WIDTH * lcddsp.PANEL_HEIGHT)
+    assert (0, 0, 0) not in [color for count, color in blank]
+
+
+def test_first_poll_keeps_the_journal(monkeypatch, tmp_path):
+    monkeypatch.setattr(devmgr, "tft_present", lambda: True)
+    journal = str(tmp_path / "panel.state")
+    tft = lcddsp.S1TFT(34, 40, True, headless=True, journal=journal)
+    tft.fill((0, 0, 255))
+    tft.close()
+
+    # A restart: the panel still shows the frame the journal recorded
+    tft = lcddsp.S1TFT(34, 40, True, lazy=True, headless=True, journal=journal)
+    tft.imageBuffer.paste((0, 0, 255, 255), (0, 0, tft.width, tft.height))
+    tft.textBuffer.paste(tft.textFill, (0, 0, tft.width, tft.height))
+    devmgr.DeviceManager(tft, led=False).poll()
+    assert tft.endpoint.packets == 1
@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip("PIL")
+usb_core = pytest.importorskip("usb.core")
+
+import lcddsp
+
+
+def make_tft(tmp_path):
+    tft = lcddsp.S1TFT(34, 40, True, inflight=1, headless=True, journal=str(tmp_path / "panel.state"))
+    tft.fill((10, 120, 200))
+    return tft
+
+
+def test_restart_skips_tiles_the_panel_shows(tmp_path):
+    make_tft(tmp_path)
+    tft = lcddsp.S1TFT(34, 40, True, inflight=1, headless=True, journal=str(tmp_path / "panel.state"))
+    tft.imageBuffer.paste((10, 120, 200, 255), (0, 0, tft.width, tft.height))
+    tft.textBuffer.paste(tft.textFill, (0, 0, tft.width, tft.height))
+    tft.render()
+    # Only the orientation packet goes out
+    assert tft.endpoint.packets == 1
+
+
+def test_failed_write_replays_whole_frame(tmp_path):
+    tft = make_tft(tmp_path)
+    panel = tft.endpoint
+    write = panel.write
+
+    def failing(data, timeout=None):
+        raise usb_core.USBError("gone")
+
+    panel.write = failing
+    tft.imageBuffer.paste((255, 0, 0, 255), (0, 0, 34, 40))
+    tft.mark_dirty((0, 0, 34, 40))
+    tft.render()
+    assert tft.writer is None
+
+    # The panel comes back power cycled and blank
+    panel.write = write
+    panel.framebuffer[:] = bytes(len(panel.framebuffer))
+    panel.packets = 0
+    tft.render()
+    assert panel.packets == 1 + tft.dirty.cols * tft.dirty.rows
+    assert panel.image().getpixel((0, 0)) == (152, 0, 0)
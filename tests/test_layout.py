@@ -0,0 +1,137 @@
+import os
+
+import pytest
+
+pytest.importorskip("PIL")
+pytest.importorskip("usb.core")
+pytest.importorskip("yaml")
+pytest.importorskip("serial")
+
+import layout
+
+GOOD = """
+orientation: vertical
+led: {mode: breathing, brightness: 1, speed: 1}
+widgets:
+  - {type: text, x: 10, y: 120, text: HELLO, size: 20, color: [255, 255, 0]}
+"""
+
+
+def write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def test_load_layout_accepts_a_valid_file(tmp_path):
+    loaded = layout.load_layout(write(tmp_path / "a.yaml", GOOD))
+    assert loaded["tile"] == (34, 40)
+    assert loaded["widgets"][0]["text"] == "HELLO"
+
+
+@pytest.mark.parametrize("bad", [
+    GOOD.replace("breathing", "breathin"),
+    GOOD.replace("brightness: 1", "brightness: 9"),
+    GOOD.replace("x: 10", "x: ten"),
+    GOOD.replace("size: 20", "size: 0"),
+    GOOD.replace("[255, 255, 0]", "[255, 255]"),
+    GOOD.replace("text: HELLO", "txt: HELLO"),
+    GOOD.replace("type: text", "type: clock"),
+])
+def test_load_layout_rejects_bad_fields(tmp_path, bad):
+    with pytest.raises(ValueError):
+        layout.load_layout(write(tmp_path / "a.yaml", bad))
+
+
+class Manager:
+    tft = None
+    led = None
+
+    def set_led(self, *settings):
+        self.led = settings
+
+
+def test_bad_edit_keeps_the_previous_layout(tmp_path):
+    path = write(tmp_path / "a.yaml", GOOD)
+    manager = Manager()
+    display = layout.LayoutDisplay(path, manager)
+    previous, led = display.layout, manager.led
+
+    write(tmp_path / "a.yaml", GOOD.replace("breathing", "breathin"))
+    display.mtime = 0
+    assert not display.check()
+    assert display.layout is previous
+    assert manager.led == led
+
+
+def test_geometry_change_keeps_the_display_headless(tmp_path):
+    old = layout.load_layout(write(tmp_path / "a.yaml", GOOD))
+    new = layout.load_layout(write(tmp_path / "b.yaml", GOOD + "tile: [17, 40]\n"))
+    tft = layout.build_display(old, headless=True, capture=2)
+    tft.render()
+    rebuilt = layout.reload_layout(tft, old, new)
+    assert rebuilt is not tft
+    assert rebuilt.headless and rebuilt.capture == 2
+    assert tft.writer is None
+
+
+def test_geometry_change_keeps_the_journal(tmp_path):
+    old = layout.load_layout(write(tmp_path / "a.yaml", GOOD))
+    new = layout.load_layout(write(tmp_path / "b.yaml", GOOD + "tile: [17, 40]\n"))
+    journal = str(tmp_path / "panel.state")
+    tft = layout.build_display(old, headless=True, journal=journal)
+    assert tft.journal.path == journal
+    assert layout.reload_layout(tft, old, new).journal.path == journal
+
+
+@pytest.mark.parametrize("tile", ["[0, 40]", "[40, 52]", "[34]", "[34, x]"])
+def test_load_layout_rejects_bad_tiles(tmp_path, tile):
+    with pytest.raises(ValueError):
+        layout.load_layout(write(tmp_path / "a.yaml", GOOD + f"tile: {tile}\n"))
+
+
+def test_background_is_relative_to_the_layout_file(tmp_path):
+    (tmp_path / "layouts").mkdir()
+    layout.lcddsp.Image.new("RGB", (170, 320), (255, 0, 0)).save(tmp_path / "red.png")
+    path = write(tmp_path / "layouts" / "a.yaml", GOOD + "background: ../red.png\n")
+    loaded = layout.load_layout(path)
+    assert os.path.exists(loaded["background"])
+
+
+def test_removing_the_background_clears_it(tmp_path):
+    layout.lcddsp.Image.new("RGB", (170, 320), (255, 0, 0)).save(tmp_path / "red.png")
+    old = layout.load_layout(write(tmp_path / "a.yaml", GOOD + "background: red.png\n"))
+    new = layout.load_layout(write(tmp_path / "b.yaml", GOOD))
+    tft = layout.build_display(old, headless=True)
+    tft.render()
+    assert layout.reload_layout(tft, old, new) is tft
+    tft.render()
+    assert (248, 0, 0) not in [color for count, color in tft.endpoint.image().getcolors(54400)]
+
+
+MARQUEE = GOOD + "  - {type: marquee, x: 12, y: 200, text: NEWS, width: 100, step: 4}\n"
+
+
+def test_marquee_widget_scrolls_on_the_tile_grid(tmp_path):
+    loaded = layout.load_layout(write(tmp_path / "a.yaml", MARQUEE + "tile: [8, 8]\n"))
+    tft = layout.build_display(loaded, headless=True)
+    marquee = tft.objects[1]
+    assert isinstance(marquee, layout.lcddsp.LCDMarquee)
+    assert (marquee.x, marquee.y, marquee.step) == (10, 200, 4)
+    tft.drawObjects()
+    tft.drawObjects()
+    assert marquee.offset == 8
+
+
+@pytest.mark.parametrize("bad", ["width: wide", "step: 1.5", "gap: [4]"])
+def test_load_layout_rejects_bad_marquee_fields(tmp_path, bad):
+    with pytest.raises(ValueError):
+        layout.load_layout(write(tmp_path / "a.yaml", MARQUEE.replace("step: 4", bad)))
+
+
+def test_preview_writes_every_frame_in_screen_orientation(tmp_path):
+    paths = layout.preview(write(tmp_path / "a.yaml", MARQUEE), str(tmp_path / "out"), frames=3)
+    assert len(paths) == 3
+    frames = [layout.lcddsp.Image.open(path) for path in paths]
+    assert all(frame.size == (170, 320) for frame in frames)
+    # The marquee moved between the frames
+    assert frames[0].tobytes() != frames[1].tobytes()
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+pytest.importorskip("fastapi")
+httpx = pytest.importorskip("httpx")
+
+import anyio
+
+from acemagic_s1 import loadtest
+from acemagic_s1.main import app
+
+CONFIG = os.path.join(os.path.dirname(__file__), "..", "hypercorn_conf.py")
+
+
+def post(target, path, body=None):
+    async def send():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=target), base_url="http://test") as http:
+            return await http.post(path, json=body)
+
+    return anyio.run(send)
+
+
+def test_stand_in_routes_stay_out_of_the_api():
+    mix, skipped = loadtest.available_mix(loadtest.DEFAULT_MIX, app)
+    assert sorted(skipped) == ["display", "led"]
+    mix, skipped = loadtest.available_mix(loadtest.DEFAULT_MIX, loadtest.simulated_app())
+    assert skipped == []
+
+
+def test_stand_in_routes_write_to_the_simulated_devices():
+    target = loadtest.simulated_app()
+    assert post(target, "/led").status_code == 200
+    assert target.state.led.written == loadtest.LED_PACKET_SIZE
+    assert post(target, "/display/tiles", {"tiles": 3}).json() == {"packets": 3}
+    assert target.state.tft.packets == 3
+    assert post(target, "/display/tiles", {"tiles": 41}).status_code == 422
+
+
+def test_load_mix_reaches_the_devices():
+    led = loadtest.run_worker("asyncio", 4, 4, {"led": 1})
+    display = loadtest.run_worker("asyncio", 4, 4, {"display": 1})
+    assert led["errors"] == display["errors"] == 0
+    assert led["led_bytes"] == 4 * loadtest.LED_PACKET_SIZE and display["tft_packets"] >= 4
+
+
+def test_worker_defaults_come_from_the_hypercorn_config(monkeypatch):
+    monkeypatch.setenv("WORKER_CLASS", "trio")
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    assert loadtest.hypercorn_defaults(CONFIG) == ("trio", 3)
+    assert loadtest.hypercorn_defaults("missing.py") == ("asyncio", 1)
@@ -0,0 +1,56 @@
+import pytest
+
+pytest.importorskip("PIL")
+pytest.importorskip("usb.core")
+
+import lcddsp
+
+
+def window_tiles(tft, marquee):
+    tft.mark_all_clean()
+    tft.mark_dirty((marquee.x, marquee.y, marquee.x + marquee.width - 1, marquee.y + marquee.windowHeight - 1))
+    return list(tft.dirty.tiles())
+
+
+@pytest.mark.parametrize("tile, vertical", [
+    ((8, 8), True),
+    ((8, 8), False),
+    ((34, 40), True),
+    ((40, 34), False),
+])
+def test_window_covers_whole_device_tiles(tile, vertical):
+    tft = lcddsp.S1TFT(*tile, vertical, headless=True)
+    marquee = lcddsp.LCDMarquee(12, 20, "SCROLLING TEXT", width=50)
+    tft.addObject(marquee)
+    covered = sum(w * h for x, y, w, h in (tft.tile_box(col, row) for col, row in window_tiles(tft, marquee)))
+    assert covered == marquee.width * marquee.windowHeight
+    assert marquee.x <= 12 and marquee.y <= 20
+    assert marquee.x + marquee.width >= 62
+
+
+def test_vertical_window_follows_the_cut_down_device_row():
+    # 170 is not a multiple of 8, so screen x 0 and 1 are the two pixel last device row
+    # and the screen grid starts at 2
+    tft = lcddsp.S1TFT(8, 8, True, headless=True)
+    marquee = lcddsp.LCDMarquee(12, 20, "SCROLLING TEXT", width=6)
+    tft.addObject(marquee)
+    assert (marquee.x, marquee.y, marquee.width) == (10, 16, 8)
+
+
+def test_scrolling_only_repaints_the_window():
+    tft = lcddsp.S1TFT(8, 8, True, inflight=1, headless=True)
+    marquee = lcddsp.LCDMarquee(12, 20, "SCROLLING TEXT", width=60)
+    tft.addObject(marquee)
+    window = set(window_tiles(tft, marquee))
+    tft.mark_all_dirty()
+    tft.drawObjects()
+    tft.render()
+    first = tft.endpoint.image()
+
+    tft.drawObjects()
+    assert tft.dirty.count() > 0
+    assert set(tft.dirty.tiles()) <= window
+    tft.render()
+    second = tft.endpoint.image()
+    assert marquee.offset == 2 * marquee.step
+    assert first.tobytes() != second.tobytes()
@@ -0,0 +1,111 @@
+import os
+
+import pytest
+
+pytest.importorskip("PIL")
+usb_core = pytest.importorskip("usb.core")
+
+from PIL import Image
+
+import lcddsp
+import pages
+
+
+def failing(data, timeout=None):
+    raise usb_core.USBError("gone")
+
+
+def test_fill_replays_tiles_lost_on_the_fast_path():
+    tft = lcddsp.S1TFT(34, 40, True, inflight=1, headless=True)
+    panel = tft.endpoint
+    write = panel.write
+    panel.write = failing
+    tft.fill((255, 0, 0))
+    assert tft.writer is None
+    assert tft.dirty.count() == tft.dirty.cols * tft.dirty.rows
+
+    panel.write = write
+    tft.render()
+    # Vertical mode dims the colour under the empty text fill, 255 becomes 155 and 152 in RGB565
+    assert panel.image().getcolors() == [(lcddsp.PANEL_WIDTH * lcddsp.PANEL_HEIGHT, (152, 0, 0))]
+
+
+def test_page_switch_replays_tiles_lost_on_the_fast_path():
+    tft = lcddsp.S1TFT(40, 34, False, inflight=1, headless=True)
+    manager = pages.PageManager(tft)
+    manager.add(pages.LCDPage("red", Image.new("RGB", (tft.width, tft.height), (255, 0, 0))))
+    manager.add(pages.LCDPage("blue", Image.new("RGB", (tft.width, tft.height), (0, 0, 255))))
+    manager.show("red")
+
+    panel = tft.endpoint
+    write = panel.write
+    panel.write = failing
+    manager.show("blue")
+    assert tft.writer is None
+
+    panel.write = write
+    tft.render()
+    assert panel.image().getcolors() == [(lcddsp.PANEL_WIDTH * lcddsp.PANEL_HEIGHT, (0, 0, 248))]
+
+
+def test_close_stops_the_workers():
+    tft = lcddsp.S1TFT(34, 40, True, headless=True, workers=2)
+    tft.render()
+    pool = tft.pool
+    assert pool is not None
+    tft.close()
+    assert tft.pool is None and tft.writer is None
+    with pytest.raises(RuntimeError):
+        pool.submit(print)
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA"])
+def test_encode_rgb565_packs_every_channel_value(mode):
+    # Every red and green pair, then every green and blue pair, covers both output bytes
+    pixels = [(v >> 8, v & 0xFF, 0) for v in range(65536)] + [(0, v >> 8, v & 0xFF) for v in range(65536)]
+    image = Image.new("RGB", (256, 512))
+    image.putdata(pixels)
+    expected = b"".join(((r & 0xF8) << 8 | (g & 0xFC) << 3 | b >> 3).to_bytes(2, "big") for r, g, b in pixels)
+    assert lcddsp.encode_rgb565(image.convert(mode)) == expected
+
+
+@pytest.mark.parametrize("d_width, d_height", [(52, 40), (0, 40), (8, 256)])
+def test_tiles_must_fit_one_packet(d_width, d_height):
+    with pytest.raises(ValueError):
+        lcddsp.S1TFT(d_width, d_height, True, lazy=True, headless=True)
+
+
+def test_a_failed_fill_gives_its_packet_back():
+    tft = lcddsp.S1TFT(34, 40, True, inflight=1, headless=True)
+    with pytest.raises(ValueError):
+        tft.send_encoded(bytes(lcddsp.TILE_PAYLOAD_SIZE + 2), 0, 0)
+    tft.fill((0, 255, 0))
+    assert tft.endpoint.image().getcolors() == [(lcddsp.PANEL_WIDTH * lcddsp.PANEL_HEIGHT, (0, 152, 0))]
+
+
+def test_synchronous_writer_keeps_its_packet_on_unexpected_errors():
+    class Broken:
+        def write(self, data, timeout=None):
+            raise RuntimeError("driver bug")
+
+    writer = lcddsp.TileWriter(Broken(), inflight=1)
+    with pytest.raises(RuntimeError):
+        writer.submit(writer.acquire())
+    assert writer.free.qsize() == 1
+
+
+def test_capture_keeps_the_last_frames_in_screen_orientation(tmp_path):
+    tft = lcddsp.S1TFT(34, 40, True, inflight=1, headless=True, capture=2)
+    colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (255, 0, 255)]
+    # One frame per colour, a marker in the top left corner of the screen pins the orientation down
+    for color in colors:
+        tft.fill(color, (0, 0, 20, 40))
+    tft.close()
+
+    paths = tft.endpoint.export_frames(str(tmp_path))
+    assert len(paths) == 2 and sorted(os.listdir(tmp_path)) == [os.path.basename(path) for path in paths]
+    for path, color in zip(paths, colors[-2:]):
+        frame = Image.open(path).convert("RGB")
+        assert frame.size == (tft.width, tft.height)
+        assert frame.getpixel((5, 5)) == tuple(152 if c else 0 for c in color)
+        assert frame.getpixel((tft.width - 5, tft.height - 5)) == (0, 0, 0)
@@ -0,0 +1,77 @@
+import pytest
+
+pytest.importorskip("PIL")
+pytest.importorskip("usb.core")
+
+from PIL import Image
+
+import lcddsp
+
+
+def test_mark_rect_sets_the_rectangle():
+    tiles = lcddsp.TileMap(8, 5)
+    tiles.mark_rect(2, 1, 4, 3)
+    assert sorted(tiles.tiles()) == sorted((c, r) for c in range(2, 5) for r in range(1, 4))
+
+
+def test_mark_rect_is_clamped_to_the_grid():
+    tiles = lcddsp.TileMap(8, 5)
+    tiles.mark_rect(-3, -1, 20, 0)
+    assert list(tiles.tiles()) == [(c, 0) for c in range(8)]
+    tiles.clear()
+    tiles.mark_rect(6, 4, 2, 9)
+    assert not tiles
+
+
+def test_tiles_are_in_device_row_major_order():
+    tiles = lcddsp.TileMap(8, 5)
+    tiles.mark(7, 0)
+    tiles.mark(0, 2)
+    tiles.mark(3, 1)
+    assert tiles.take() == [(7, 0), (3, 1), (0, 2)]
+    assert not tiles
+
+
+def covered(tft, bounds):
+    # Device tiles a screen rectangle touches, by rotating every pixel of it
+    x1, y1, x2, y2 = bounds
+    tiles = set()
+    for x in range(x1, x2 + 1):
+        for y in range(y1, y2 + 1):
+            dx, dy = (y, tft.width - 1 - x) if tft.isVertical else (x, y)
+            tiles.add((dx // tft.tile_w, dy // tft.tile_h))
+    return tiles
+
+
+@pytest.mark.parametrize("d_width, d_height, vertical", [
+    (34, 40, True), (40, 34, False), (8, 8, True), (8, 8, False), (16, 16, True), (16, 16, False)])
+@pytest.mark.parametrize("bounds", [(0, 0, 0, 0), (5, 3, 60, 90), (100, 0, 169, 169), (0, 150, 169, 169)])
+def test_mark_dirty_maps_screen_to_device_tiles(d_width, d_height, vertical, bounds):
+    tft = lcddsp.S1TFT(d_width, d_height, vertical, lazy=True, headless=True)
+    tft.mark_all_clean()
+    tft.mark_dirty(bounds)
+    assert set(tft.dirty.tiles()) == covered(tft, bounds)
+
+
+@pytest.mark.parametrize("d_width, d_height, vertical, workers",
+                         [(34, 40, True, 0), (8, 8, True, 0), (16, 16, False, 0), (34, 40, True, 2), (8, 8, False, 2)])
+def test_render_covers_the_whole_panel(d_width, d_height, vertical, workers):
+    tft = lcddsp.S1TFT(d_width, d_height, vertical, lazy=True, headless=True, workers=workers)
+    tft.imageBuffer = Image.effect_noise((tft.width, tft.height), 64).convert("RGBA")
+    tft.textBuffer = Image.new("RGBA", (tft.width, tft.height), (0, 0, 0, 0))
+    tft.render()
+    expected = lcddsp.decode_rgb565(lcddsp.encode_rgb565(tft.imageBuffer), (tft.width, tft.height))
+    tft.close()
+    assert tft.endpoint.image().tobytes() == expected.tobytes()
+
+
+@pytest.mark.parametrize("d_width, d_height, vertical", [(34, 40, True), (16, 16, False)])
+def test_fill_reaches_the_panel_edges(d_width, d_height, vertical):
+    tft = lcddsp.S1TFT(d_width, d_height, vertical, lazy=True, headless=True)
+    tft.fill((0, 255, 0))
+    assert len(tft.endpoint.image().getcolors()) == 1
+    # Erasing part of it, as a removed widget does, leaves the same colour
+    tft.erase((0, 0, 60, 60))
+    tft.mark_dirty((0, 0, 60, 60))
+    tft.render()
+    assert len(tft.endpoint.image().getcolors()) == 1